@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.metrics import PIPELINE_QUEUE_DEPTH, PIPELINE_IN_PROGRESS, PIPELINE_STAGE_SECONDS, PIPELINE_STAGE_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# A stage handler processes one item and returns the name of the next stage,
+# or None when the item is finished.
+Handler = Callable[[Any], Awaitable[Optional[str]]]
+
+
+class Pipeline:
+    """Items flow between named stages, each with its own queue and worker count.
+
+    Handlers route items by returning the next stage name, so a stage can
+    loop back (e.g. retry a download) or skip ahead. If a handler raises,
+    `on_error(item, exc)` runs and the item is finished. Callers `await
+    run(stage, item)` until their item leaves the pipeline.
+    """
+
+    def __init__(self, stages: Dict[str, Tuple[Handler, int]], on_error: Callable[[Any, Exception], Awaitable[None]]):
+        self.stages = stages
+        self.on_error = on_error
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        if self._workers:
+            return
+        for name, (handler, concurrency) in self.stages.items():
+            self._queues[name] = asyncio.Queue()
+            for _ in range(max(1, concurrency)):
+                self._workers.append(asyncio.create_task(self._work(name, handler)))
+        logger.info("Pipeline started: " + ", ".join(f"{name}={max(1, c)}" for name, (_, c) in self.stages.items()))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+    async def run(self, stage: str, item: Any):
+        """Feed `item` in at `stage` and wait until it's finished"""
+        self.start()
+        done = asyncio.get_running_loop().create_future()
+        self._put(stage, (item, done))
+        # If the caller is cancelled, `done` is cancelled too and stages drop the item
+        await done
+
+    def _put(self, stage: str, entry):
+        self._queues[stage].put_nowait(entry)
+        PIPELINE_QUEUE_DEPTH.labels(stage).inc()
+
+    async def _work(self, stage: str, handler: Handler):
+        queue = self._queues[stage]
+        while True:
+            item, done = await queue.get()
+            PIPELINE_QUEUE_DEPTH.labels(stage).dec()
+            if done.done():
+                continue  # caller gave up (worker shutdown)
+
+            started = time.monotonic()
+            PIPELINE_IN_PROGRESS.labels(stage).inc()
+            try:
+                next_stage = await handler(item)
+            except asyncio.CancelledError:
+                done.cancel()
+                raise
+            except Exception as e:
+                PIPELINE_STAGE_TOTAL.labels(stage, "error").inc()
+                try:
+                    await self.on_error(item, e)
+                except Exception as err:
+                    logger.error(f"Pipeline error handler failed in {stage}: {err}")
+                done.done() or done.set_result(None)
+                continue
+            finally:
+                PIPELINE_IN_PROGRESS.labels(stage).dec()
+                PIPELINE_STAGE_SECONDS.labels(stage).observe(time.monotonic() - started)
+
+            PIPELINE_STAGE_TOTAL.labels(stage, "ok").inc()
+            if done.done():
+                continue
+            if next_stage is None:
+                done.set_result(None)
+            else:
+                self._put(next_stage, (item, done))
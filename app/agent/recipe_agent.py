@@ -1,79 +1,275 @@
 import logging
+import time
 import traceback
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from sqlalchemy.orm import Session
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
-from app.database import SessionLocal, Recipe, ImportJob
-from app.utils import get_post_type
+from app.config import get_settings
+from app.database import AsyncSessionLocal, Recipe, ImportJob
+from app.metrics import EXTRACTION_TIER_TOTAL, EXTRACTION_TIER_SECONDS, DB_COMMIT_SECONDS, timed
+from app.notify import JOB_EVENTS_CHANNEL, publish_event
+from app.schemas import JobStatusResponse, ScrapedContent, RecipeData
+from app.search import index_recipe
+from app.utils import get_post_type, canonical_key
+from app.agent.pipeline import Pipeline
 from app.agent.tools.scraping import ScrapingTool
 from app.agent.tools.extraction import ExtractionTool
+from app.services.media_pool import media_pool
+from app.services.openai_extractor import openai_extractor
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class RecipeJob:
+    """One import moving through the pipeline, with what each stage produced"""
+    job_id: str
+    user_id: str
+    source_url: str
+    key: str
+    content: Optional[ScrapedContent] = None
+    draft: Optional[RecipeData] = None  # caption-only result that wasn't complete enough
+    caption_tried: bool = False
+    video_source: Optional[str] = None  # video URL (streaming) or downloaded temp file
+    video_path: Optional[str] = None  # temp file to delete
+    stream_failed: bool = False
+    video_done: bool = False
+    images_done: bool = False
+    frames: list[bytes] = field(default_factory=list)
+    images: list[str] = field(default_factory=list)
+    recipe: Optional[RecipeData] = None
+    tier_started: dict = field(default_factory=dict)  # media tier -> monotonic start, spans stages
+
+    def cleanup(self):
+        if self.video_path:
+            Path(self.video_path).unlink(missing_ok=True)
+            self.video_path = None
 
 
 class RecipeAgent:
-    """Orchestrates: Scrape -> Extract -> Save"""
+    """Orchestrates: Scrape -> Extract -> Save, as a staged pipeline.
+
+        scrape -> llm (caption) -------------------------------> persist
+                    \\-> media -> frames -> llm (vision) --------/
+
+    Every stage has its own queue and workers (PIPELINE_*_CONCURRENCY), so
+    network-bound scraping and downloads, CPU-bound frame decoding and
+    quota-bound OpenAI calls are sized independently instead of sharing one
+    job slot.
+    """
 
     def __init__(self):
         self.scraper = ScrapingTool()
         self.extractor = ExtractionTool()
+        self.pipeline = Pipeline(
+            {
+                # A scrape worker waits out its whole (batched) Apify run, so fewer
+                # workers than apify_batch_max_size could never fill a batch
+                "scrape": (self._scrape, max(settings.pipeline_scrape_concurrency, settings.apify_batch_max_size)),
+                "llm": (self._extract, settings.pipeline_llm_concurrency),
+                "media": (self._fetch_media, settings.pipeline_media_concurrency),
+                "frames": (self._prepare_frames, settings.pipeline_frames_concurrency or media_pool.size),
+                "persist": (self._persist, settings.pipeline_persist_concurrency),
+            },
+            on_error=self._fail,
+        )
 
     async def process_job(self, job_data: dict):
-        job_id = job_data["job_id"]
-        source_url = job_data["source_url"]
-        user_id = job_data["user_id"]
-
-        logger.info(f"Agent starting job {job_id} for {source_url}")
+        job = RecipeJob(
+            job_id=job_data["job_id"],
+            user_id=job_data["user_id"],
+            source_url=job_data["source_url"],
+            key=canonical_key(job_data["source_url"]),
+        )
+        logger.info(f"Agent starting job {job.job_id} for {job.source_url}")
+        try:
+            await self.pipeline.run("scrape", job)
+        finally:
+            job.cleanup()
 
-        db: Session = SessionLocal()
-        job = None
+    async def close(self):
+        await self.pipeline.stop()
 
-        try:
-            # Create/update job record
-            job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
-            if not job:
-                job = ImportJob(id=job_id, user_id=user_id, source_url=source_url, status="processing")
-                db.add(job)
+    async def _scrape(self, job: RecipeJob) -> str:
+        # Create/update job record
+        async with AsyncSessionLocal() as db:
+            record = await db.get(ImportJob, job.job_id)
+            if not record:
+                db.add(ImportJob(id=job.job_id, user_id=job.user_id, source_url=job.source_url, canonical_key=job.key, status="processing"))
             else:
-                job.status = "processing"
-            db.commit()
+                record.status = "processing"
+            with timed(DB_COMMIT_SECONDS, "job_start"):
+                await db.commit()
+        await self._update_job(job.job_id, stage="scraping")
+
+        job.content = await self.scraper.execute(job.source_url)
+
+        # Check duration limit (90 seconds)
+        if job.content.duration and job.content.duration > 90:
+            raise ValueError(f"Video is too long ({job.content.duration}s). Max allowed is 90s.")
+
+        await self._update_job(job.job_id, stage="extracting")
+        return "llm"
 
-            # Step 1: Scrape
-            scraped = await self.scraper.execute(source_url)
+    async def _extract(self, job: RecipeJob) -> str:
+        """LLM stage: the caption-only pass first, vision once frames or images are ready"""
+        content = job.content
+        if job.frames:
+            frames, job.frames = job.frames, []
+            try:
+                job.recipe = await self.extractor.execute(content, frames=frames)
+                self._end_tier(job, "video", "accepted")
+                return "persist"
+            except Exception as e:
+                self._end_tier(job, "video", "failed")
+                logger.warning(f"Video failed, trying images: {e}")
+                job.video_done = True
+                return "media"
 
-            # Check duration limit (90 seconds)
-            if scraped.duration and scraped.duration > 90:
-                raise ValueError(f"Video is too long ({scraped.duration}s). Max allowed is 90s.")
+        if job.images:
+            images, job.images = job.images, []
+            try:
+                job.recipe = await self.extractor.execute(content, images=images)
+                self._end_tier(job, "images", "accepted")
+                return "persist"
+            except Exception as e:
+                self._end_tier(job, "images", "failed")
+                if job.draft is None or not job.draft.ingredients:
+                    raise
+                logger.warning(f"Images failed: {e}")
+                return "media"
 
-            # Step 2: Extract
-            recipe_data = await self.extractor.execute(scraped)
+        if not job.caption_tried:
+            job.caption_tried = True
+            draft, score = await self.extractor.caption_tier(content)
+            if draft is not None and score >= settings.text_tier_min_score:
+                job.recipe = draft
+                return "persist"
+            job.draft = draft
+        return "media"
 
-            # Step 3: Save recipe
+    async def _fetch_media(self, job: RecipeJob) -> str:
+        """Network stage: pick the video source (stream URL or downloaded file) or download the images"""
+        content = job.content
+        if content.video_url and not job.video_done:
+            # A streaming failure comes back here for the download: still the same tier
+            job.tier_started.setdefault("video", time.monotonic())
+            if settings.video_streaming and not job.stream_failed:
+                job.video_source = content.video_url
+                return "frames"
+            try:
+                job.video_path = await self.extractor.download(content.video_url, suffix=".mp4", timeout=300.0)
+                job.video_source = job.video_path
+                return "frames"
+            except Exception as e:
+                self._end_tier(job, "video", "failed")
+                logger.warning(f"Video failed, trying images: {e}")
+                job.video_done = True
+
+        if content.image_urls and not job.images_done:
+            job.images_done = True
+            job.tier_started["images"] = time.monotonic()
+            job.images = await self.extractor.download_images_as_b64(content.image_urls)
+            if job.images:
+                return "llm"
+            self._end_tier(job, "images", "failed")
+
+        # A partial caption recipe beats failing the job
+        if job.draft is not None and job.draft.ingredients:
+            logger.warning("No usable media, keeping the caption-only extraction")
+            job.recipe = job.draft
+            return "persist"
+
+        raise Exception("No media available for extraction")
+
+    async def _prepare_frames(self, job: RecipeJob) -> str:
+        """CPU stage: decode, select and encode frames in the media pool"""
+        streamed = job.video_path is None
+        try:
+            job.frames = await openai_extractor.extract_frames(job.video_source)
+        except Exception as e:
+            logger.warning(f"Frame extraction failed: {e}")
+            job.frames = []
+        finally:
+            job.cleanup()
+
+        if job.frames:
+            return "llm"
+        if streamed:
+            # The CDN didn't cooperate with range requests: download the whole file instead
+            logger.warning("No frames from streamed video, downloading instead")
+            job.stream_failed = True
+        else:
+            self._end_tier(job, "video", "failed")
+            job.video_done = True
+        return "media"
+
+    def _end_tier(self, job: RecipeJob, tier: str, outcome: str):
+        """Count a media tier's outcome and observe its wall time across the stages it spanned"""
+        EXTRACTION_TIER_TOTAL.labels(tier, outcome).inc()
+        started = job.tier_started.pop(tier, None)
+        if started is not None:
+            EXTRACTION_TIER_SECONDS.labels(tier).observe(time.monotonic() - started)
+
+    async def _persist(self, job: RecipeJob) -> None:
+        await self._update_job(job.job_id, stage="saving")
+        recipe_data = job.recipe
+        async with AsyncSessionLocal() as db:
             recipe = Recipe(
-                user_id=user_id,
+                user_id=job.user_id,
                 title=recipe_data.title or "Untitled Recipe",
-                source_url=source_url,
-                source_type=get_post_type(source_url),
+                source_url=job.source_url,
+                canonical_key=job.key,
+                source_type=get_post_type(job.source_url),
                 data=recipe_data.model_dump()
             )
             db.add(recipe)
-            db.commit()
-            db.refresh(recipe)
+            try:
+                await db.flush()
+                # Same transaction: a saved recipe is always searchable
+                await index_recipe(db, recipe)
+                with timed(DB_COMMIT_SECONDS, "recipe"):
+                    await db.commit()
+                recipe_id = recipe.id
+            except IntegrityError:
+                # Another job already saved this post: link to that recipe instead
+                await db.rollback()
+                recipe_id = (await db.execute(select(Recipe.id).where(Recipe.canonical_key == job.key))).scalar_one()
 
-            # Mark job complete
-            job.status = "completed"
-            job.recipe_id = recipe.id
-            job.completed_at = datetime.now(timezone.utc)
-            db.commit()
+        # Mark job complete
+        await self._update_job(
+            job.job_id,
+            status="completed",
+            recipe_id=recipe_id,
+            completed_at=datetime.now(timezone.utc),
+            stage="completed",
+        )
+        logger.info(f"Job {job.job_id} completed: {recipe_data.title}")
 
-            logger.info(f"Job {job_id} completed: {recipe_data.title}")
+    async def _fail(self, job: RecipeJob, error: Exception):
+        logger.error(f"Job {job.job_id} failed: {error}\n{''.join(traceback.format_exception(error))}")
+        await self._update_job(
+            job.job_id,
+            status="failed",
+            error_message=str(error),
+            completed_at=datetime.now(timezone.utc),
+            stage="failed",
+        )
 
-        except Exception as e:
-            logger.error(f"Job {job_id} failed: {e}\n{traceback.format_exc()}")
-            if job:
-                job.status = "failed"
-                job.error_message = str(e)
-                job.completed_at = datetime.now(timezone.utc)
-                db.commit()
-        finally:
-            db.close()
+    async def _update_job(self, job_id: str, **values):
+        """Commit changes to the job row, then tell anyone watching GET /jobs/{id}"""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ImportJob, job_id)
+            if job is None:
+                return
+            for name, value in values.items():
+                setattr(job, name, value)
+            with timed(DB_COMMIT_SECONDS, "job_update"):
+                await db.commit()
+            event = JobStatusResponse.from_job(job).model_dump(mode="json")
+        await publish_event(JOB_EVENTS_CHANNEL.format(job_id), event)
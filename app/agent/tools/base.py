@@ -1,13 +1,26 @@
-
+import functools
 from abc import ABC, abstractmethod
 from typing import Any, Dict
 
+from app.metrics import TOOL_SECONDS, timed
+
 class BaseTool(ABC):
     """Abstract base class for all agent tools"""
     
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Every tool's execute() is timed, whichever stage or path calls it
+        execute = cls.__dict__.get("execute")
+        if execute is not None and not getattr(execute, "__isabstractmethod__", False):
+            @functools.wraps(execute)
+            async def timed_execute(self, *args, **kwargs):
+                with timed(TOOL_SECONDS, self.name):
+                    return await execute(self, *args, **kwargs)
+            cls.execute = timed_execute
     
     @abstractmethod
     async def execute(self, *args, **kwargs) -> Any:
@@ -1,63 +1,121 @@
+import asyncio
 import base64
 import logging
 import tempfile
-import httpx
-from pathlib import Path
+import time
 from app.agent.tools.base import BaseTool
+from app.config import get_settings
+from app.services import media
+from app.services.http_client import get_http_client, USER_AGENT
+from app.services.media_pool import media_pool
 from app.services.openai_extractor import openai_extractor
 from app.schemas import ScrapedContent, RecipeData
+from app.metrics import (
+    EXTRACTION_TIER_TOTAL, EXTRACTION_TIER_SECONDS, EXTRACTION_TEXT_COMPLETENESS,
+    MEDIA_DOWNLOAD_SECONDS, MEDIA_DOWNLOAD_BYTES, timed,
+)
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    "User-Agent": USER_AGENT
 }
 
 
+def completeness(recipe: RecipeData) -> float:
+    """0-1 score of how usable a recipe is on its own: enough ingredients,
+    amounts for them, and enough steps to follow"""
+    ingredients = recipe.ingredients
+    if not ingredients or not recipe.steps:
+        return 0.0
+    quantified = sum(1 for i in ingredients if str(i.quantity).strip().lower() not in ("", "0", "none", "null", "n/a"))
+    return round(
+        0.4 * min(len(ingredients) / 4, 1.0)
+        + 0.3 * quantified / len(ingredients)
+        + 0.3 * min(len(recipe.steps) / 3, 1.0),
+        3,
+    )
+
+
 class ExtractionTool(BaseTool):
     def __init__(self):
         super().__init__(name="Extractor", description="Extracts recipe data using AI")
 
-    async def execute(self, content: ScrapedContent) -> RecipeData:
-        # 1. Try video first
-        if content.video_url:
-            try:
-                video_path = await self._download(content.video_url, suffix=".mp4", timeout=300.0)
-                try:
-                    return await openai_extractor.extract_from_video(video_path, content.caption, content.author)
-                finally:
-                    Path(video_path).unlink(missing_ok=True)
-            except Exception as e:
-                logger.warning(f"Video failed, trying images: {e}")
+    async def execute(self, content: ScrapedContent, frames: list[bytes] = None, images: list[str] = None) -> RecipeData:
+        """One extraction request: vision over video `frames` or post `images`
+        when given, otherwise the caption alone. The agent's stages decide
+        which tier to try next (see RecipeAgent)."""
+        if frames:
+            return await openai_extractor.extract_from_frames(frames, content.caption, content.author)
+        if images:
+            return await openai_extractor.extract_from_images(images, content.caption, content.author)
+        return await openai_extractor.extract_from_caption(content.caption, content.author)
 
-        # 2. Fallback to images
-        if content.image_urls:
-            images_b64 = await self._download_images_as_b64(content.image_urls)
-            if images_b64:
-                return await openai_extractor.extract_from_images(images_b64, content.caption, content.author)
+    async def caption_tier(self, content: ScrapedContent):
+        """(recipe, completeness) from the caption alone; (None, 0.0) if skipped or failed"""
+        if not settings.text_tier_enabled or len(content.caption.strip()) < settings.text_tier_min_caption_chars:
+            EXTRACTION_TIER_TOTAL.labels("text", "skipped").inc()
+            return None, 0.0
 
-        raise Exception("No media available for extraction")
+        started = time.monotonic()
+        try:
+            recipe = await self.execute(content)
+        except Exception as e:
+            EXTRACTION_TIER_TOTAL.labels("text", "failed").inc()
+            logger.warning(f"Caption extraction failed, using media: {e}")
+            return None, 0.0
+        finally:
+            EXTRACTION_TIER_SECONDS.labels("text").observe(time.monotonic() - started)
 
-    async def _download(self, url: str, suffix: str, timeout: float) -> str:
+        score = completeness(recipe)
+        EXTRACTION_TEXT_COMPLETENESS.observe(score)
+        accepted = score >= settings.text_tier_min_score
+        EXTRACTION_TIER_TOTAL.labels("text", "accepted" if accepted else "escalated").inc()
+        logger.info(f"Caption extraction scored {score} ({'accepted' if accepted else 'escalating to media'})")
+        return recipe, score
+
+    async def download(self, url: str, suffix: str, timeout: float) -> str:
         """Download a file to a temp path and return the path."""
-        async with httpx.AsyncClient(headers=HEADERS, timeout=timeout) as client:
-            async with client.stream("GET", url, follow_redirects=True) as resp:
+        client = get_http_client("media")
+        with timed(MEDIA_DOWNLOAD_SECONDS, "video"):
+            async with client.stream("GET", url, headers=HEADERS, timeout=timeout) as resp:
                 resp.raise_for_status()
                 with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
                     async for chunk in resp.aiter_bytes():
                         tmp.write(chunk)
+                        MEDIA_DOWNLOAD_BYTES.labels("video").inc(len(chunk))
                     return tmp.name
 
-    async def _download_images_as_b64(self, urls: list[str]) -> list[str]:
-        """Download images and return as base64 data URLs."""
-        result = []
-        async with httpx.AsyncClient(headers=HEADERS, timeout=60.0) as client:
-            for url in urls[:5]:
+    async def download_images_as_b64(self, urls: list[str]) -> list[str]:
+        """Download images concurrently and return them as base64 data URLs,
+        deduplicated and downscaled like video frames (see media.prepare_images)."""
+        urls = list(dict.fromkeys(urls))[:5]
+        if not urls:
+            return []
+        client = get_http_client("media")
+        limit = asyncio.Semaphore(max(1, settings.image_download_concurrency))
+
+        async def fetch(url: str) -> bytes | None:
+            async with limit:
                 try:
-                    resp = await client.get(url, follow_redirects=True)
+                    with timed(MEDIA_DOWNLOAD_SECONDS, "image"):
+                        resp = await client.get(url, headers=HEADERS)
+                    MEDIA_DOWNLOAD_BYTES.labels("image").inc(len(resp.content))
                     if resp.status_code == 200:
-                        b64 = base64.b64encode(resp.content).decode()
-                        result.append(f"data:image/jpeg;base64,{b64}")
+                        return resp.content
+                    logger.warning(f"Image download failed: HTTP {resp.status_code}")
                 except Exception as e:
                     logger.warning(f"Image download failed: {e}")
-        return result
+                return None
+
+        # Post order kept; carousels often repeat the cover under another URL
+        images = list(dict.fromkeys(data for data in await asyncio.gather(*(fetch(url) for url in urls)) if data))
+        if not images:
+            return []
+        try:
+            prepared = await media_pool.run(media.prepare_images, images)
+        except Exception as e:
+            logger.warning(f"Image preparation failed, sending originals: {e}")
+            prepared = [(mime, data) for data in images if (mime := media.image_mime_type(data))]
+        return [f"data:{mime};base64,{base64.b64encode(data).decode()}" for mime, data in prepared]
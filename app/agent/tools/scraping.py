@@ -1,19 +1,28 @@
 import logging
 from app.agent.tools.base import BaseTool
+from app.cache import TieredCache
+from app.config import get_settings
 from app.services.apify_client import apify_client
 from app.services.youtube_client import youtube_client
-from app.utils import get_platform
+from app.utils import get_platform, canonical_key
 from app.schemas import ScrapedContent
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 class ScrapingTool(BaseTool):
     def __init__(self):
         super().__init__(name="Scraper", description="Scrapes content from Instagram, TikTok, or YouTube")
+        # Shared across workers; single-flight so concurrent jobs for one URL scrape once
+        self.cache = TieredCache("scrape", ttl_seconds=settings.scrape_cache_ttl_seconds)
 
     async def execute(self, url: str) -> ScrapedContent:
         platform = get_platform(url)
+        data = await self.cache.get_or_set(canonical_key(url), lambda: self._scrape(url, platform))
+        return ScrapedContent(**data)
+
+    async def _scrape(self, url: str, platform: str) -> dict:
         logger.info(f"Scraping {platform}: {url}")
 
         if platform == "youtube":
@@ -28,4 +37,4 @@ class ScrapingTool(BaseTool):
         if not content:
             raise Exception(f"No content scraped from {platform}")
 
-        return content
+        return content.model_dump()
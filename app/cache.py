@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import delete, select
+
+from app.config import get_settings
+from app.database import SessionLocal, CacheEntry
+from app.redis_client import USE_REDIS, redis_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CACHE_KEY = "eylo:cache:{}:{}"
+LOCK_KEY = "eylo:lock:{}:{}"
+
+
+def content_key(*parts: Any) -> str:
+    """Stable sha256 over JSON-serializable parts (order matters)"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class TieredCache:
+    """Two-tier cache for JSON-serializable values.
+
+    Tier 1 is a per-process LRU. Tier 2 is shared by every API/worker process:
+    Redis when configured (size-bounded by Redis' own maxmemory eviction),
+    otherwise the `cache_entries` table, trimmed to `max_rows` per namespace.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: int, max_local_items: int = None, max_rows: int = None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_local_items = max_local_items or settings.cache_local_max_items
+        self.max_rows = max_rows or settings.cache_db_max_rows
+        self._local: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        hit = self._local.get(key)
+        if hit is not None:
+            expires_at, value = hit
+            if expires_at > time.time():
+                self._local.move_to_end(key)
+                return value
+            del self._local[key]
+
+        try:
+            if USE_REDIS and redis_client:
+                raw = await redis_client.get(CACHE_KEY.format(self.namespace, key))
+                value = json.loads(raw) if raw is not None else None
+            else:
+                value = await asyncio.to_thread(self._db_get, key)
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} read failed: {e}")
+            return None
+
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: int = None):
+        ttl = ttl_seconds or self.ttl_seconds
+        self._remember(key, value, ttl)
+        try:
+            if USE_REDIS and redis_client:
+                await redis_client.set(CACHE_KEY.format(self.namespace, key), json.dumps(value), ex=ttl)
+            else:
+                await asyncio.to_thread(self._db_set, key, value, ttl)
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} write failed: {e}")
+
+    async def get_or_set(self, key: str, factory: Callable[[], Awaitable[Any]], lock_timeout: float = 300.0) -> Any:
+        """Cached value for `key`, computing it with `factory` on a miss.
+
+        Single-flight: concurrent callers in this process share one in-flight
+        computation, and with Redis a short-lived lock makes other processes
+        wait for the first one's result instead of computing it again.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await self._compute_once(key, factory, lock_timeout)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _compute_once(self, key: str, factory: Callable[[], Awaitable[Any]], lock_timeout: float) -> Any:
+        if not (USE_REDIS and redis_client):
+            value = await factory()
+            await self.set(key, value)
+            return value
+
+        lock_key = LOCK_KEY.format(self.namespace, key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + lock_timeout
+        locked = False
+        try:
+            while not (locked := bool(await redis_client.set(lock_key, token, nx=True, px=int(lock_timeout * 1000)))):
+                # Another process is computing it: wait for its result to land
+                await asyncio.sleep(0.5)
+                value = await self.get(key)
+                if value is not None:
+                    return value
+                if time.monotonic() > deadline:
+                    break
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} lock failed, computing anyway: {e}")
+
+        try:
+            value = await factory()
+            await self.set(key, value)
+            return value
+        finally:
+            if locked:
+                try:
+                    # Only release our own lock (it may have expired and been re-taken)
+                    if await redis_client.get(lock_key) == token:
+                        await redis_client.delete(lock_key)
+                except Exception:
+                    pass
+
+    def _remember(self, key: str, value: Any, ttl: int = None):
+        self._local[key] = (time.time() + (ttl or self.ttl_seconds), value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_local_items:
+            self._local.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[Any]:
+        db = SessionLocal()
+        try:
+            entry = db.get(CacheEntry, (self.namespace, key))
+            if entry is None or entry.expires_at <= datetime.utcnow():
+                return None
+            return entry.value
+        finally:
+            db.close()
+
+    def _db_set(self, key: str, value: Any, ttl: int):
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.merge(CacheEntry(namespace=self.namespace, key=key, value=value, created_at=now, expires_at=now + timedelta(seconds=ttl)))
+            db.commit()
+
+            # Evict every so often rather than on every write
+            self._writes += 1
+            if self._writes % 100 == 1:
+                self._db_evict(db, now)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _db_evict(self, db, now: datetime):
+        """Drop expired rows, then the oldest rows beyond `max_rows`"""
+        db.execute(delete(CacheEntry).where(CacheEntry.namespace == self.namespace, CacheEntry.expires_at <= now))
+        overflow = (
+            select(CacheEntry.key)
+            .where(CacheEntry.namespace == self.namespace)
+            .order_by(CacheEntry.created_at.desc())
+            .offset(self.max_rows)
+        )
+        db.execute(delete(CacheEntry).where(CacheEntry.namespace == self.namespace, CacheEntry.key.in_(overflow.scalar_subquery())))
+        db.commit()
@@ -8,24 +8,88 @@ class Settings(BaseSettings):
     # API Keys
     apify_api_token: str
     openai_api_key: str
+    openai_base_url: str = ""  # Point at a local stand-in for testing (default: api.openai.com)
     instagram_session_id: str = ""  # Optional: Instagram sessionid cookie for scraping login-gated reels
 
+    # Apify
+    apify_base_url: str = "https://api.apify.com/v2"  # Point at a local stand-in for testing
+    apify_webhook_url: str = ""  # Public URL of POST /webhooks/apify; enables webhook-driven run completion
+    apify_webhook_secret: str = ""  # Shared secret Apify sends back as ?secret=
+    apify_max_wait_seconds: int = 180  # Run deadline for a single URL...
+    apify_max_wait_per_url_seconds: int = 15  # ...plus this per extra URL in a batched run
+    apify_poll_initial_seconds: float = 1.0
+    apify_poll_max_seconds: float = 10.0
+    apify_webhook_poll_max_seconds: float = 30.0  # Fallback polling cap while waiting for a webhook
+    apify_batch_window_seconds: float = 2.0  # How long to collect URLs before starting a shared actor run
+    apify_batch_max_size: int = 20  # Start the run early once this many URLs are waiting (1 disables batching)
+
     
     # Database
     database_url: str
     
     # Queue
     redis_url: str
+    queue_batch_size: int = 4  # Max jobs claimed per dequeue
+    queue_wait_seconds: float = 5.0  # How long an idle worker waits for new jobs per dequeue
+    queue_poll_interval_seconds: float = 2.0  # DB polling interval when NOTIFY is unavailable (SQLite)
+    queue_visibility_timeout_seconds: int = 120  # Redis: requeue a dead worker's jobs after this long without a heartbeat
+    queue_heartbeat_seconds: int = 30  # Redis: worker heartbeat / reaper interval
     
     # API Settings
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     jwt_secret: str
+    job_poll_interval_seconds: float = 1.0  # GET /jobs wait/SSE: DB re-check interval without Redis pub/sub
+    job_wait_max_seconds: int = 60  # Cap on a single long-poll request
+    job_events_max_seconds: int = 900  # Close an SSE stream after this long
+    job_events_keepalive_seconds: float = 15.0  # SSE comment interval so proxies don't drop idle streams
     
     # Worker Settings
-    worker_concurrency: int = 4
+    worker_concurrency: int = 24  # Jobs in flight per worker, across all pipeline stages (keep >= apify_batch_max_size)
     retry_attempts: int = 3
     retry_delay_seconds: int = 5
+    worker_shutdown_timeout_seconds: int = 300  # Max time to drain in-flight jobs on shutdown
+
+    # Pipeline: workers per stage inside one worker process (see RecipeAgent)
+    pipeline_scrape_concurrency: int = 8  # Apify/yt-dlp calls (network); raised to apify_batch_max_size, see RecipeAgent
+    pipeline_media_concurrency: int = 8  # Video/image downloads (network)
+    pipeline_frames_concurrency: int = 0  # Frame decoding (CPU, 0 = media pool size)
+    pipeline_llm_concurrency: int = 8  # OpenAI calls (API quota, also rate limited)
+    pipeline_persist_concurrency: int = 4  # DB writes
+    
+    # Extraction
+    text_tier_enabled: bool = True  # Try a caption-only extraction before downloading media
+    text_tier_min_caption_chars: int = 80  # Shorter captions go straight to the vision tier
+    text_tier_min_score: float = 0.8  # Completeness (0-1) a caption-only result needs to be accepted
+
+    # Metrics
+    worker_metrics_port: int = 0  # Serve the worker's Prometheus metrics on this port (0 = off)
+
+    # Rate limits (shared across processes via Redis, else the DB)
+    openai_requests_per_minute: int = 500  # 0 disables
+    openai_tokens_per_minute: int = 200000  # Counted as prompt estimate + max_tokens, like OpenAI does
+    openai_max_concurrency: int = 16  # Ceiling for the adaptive (AIMD) per-process limit
+    openai_image_token_estimate: int = 800  # Rate-limit cost assumed per image
+    apify_max_concurrent_runs: int = 25  # Account-wide cap on running actor runs (0 disables)
+
+    # Media
+    video_streaming: bool = True  # Decode frames straight from the video URL instead of downloading it first
+    media_pool_workers: int = 0  # Processes for frame decoding/encoding (0 = one per CPU core)
+    media_pool_max_tasks_per_child: int = 50  # Recycle a pool process after this many tasks (Python 3.11+)
+    media_task_timeout_seconds: float = 120.0
+    image_download_concurrency: int = 5  # Parallel image fetches per post (image fallback)
+
+    # Caches (see app/cache.py)
+    cache_local_max_items: int = 512  # Per-process LRU size, per cache
+    cache_db_max_rows: int = 10000  # Row cap per cache when the DB is the shared tier
+    extraction_cache_ttl_seconds: int = 7 * 24 * 3600
+    scrape_cache_ttl_seconds: int = 3600  # Keep short: scraped video URLs are signed and expire
+    
+    # HTTP Clients (shared per process, see app/services/http_client.py)
+    http2_enabled: bool = False  # Needs the 'h2' package (httpx[http2])
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_seconds: float = 30.0
     
     # Test Mode
     test_mode: bool = False
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, String, DateTime, JSON, ForeignKey
+from sqlalchemy import create_engine, make_url, event, Column, String, Integer, Float, DateTime, JSON, DDL, ForeignKey, Index, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -23,28 +24,134 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(database_url: str):
+    """Same database through an asyncio driver: asyncpg for Postgres, aiosqlite for SQLite"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+        if "sslmode" in url.query:
+            # asyncpg spells libpq's sslmode as ssl
+            url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": url.query["sslmode"]})
+    elif url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url
+
+# Async path used by the API handlers, the DB queue and the agent, so DB round
+# trips don't block the event loop. The sync engine above stays for Alembic,
+# create_all, LISTEN connections and thread-offloaded helpers.
+async_engine = create_async_engine(
+    _async_url(settings.database_url),
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=10,
+    max_overflow=20
+)
+# expire_on_commit=False: attributes can't lazy-load under asyncio, keep them readable after commit
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 class Recipe(Base):
     __tablename__ = "recipes"
+    __table_args__ = (
+        # Newest-first listing / keyset pagination on (created_at, id)
+        Index("ix_recipes_created_at_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, index=True)
     title = Column(String)
     source_url = Column(String)
+    canonical_key = Column(String, unique=True, index=True)  # app.utils.canonical_key(source_url)
     source_type = Column(String)
     data = Column(JSON)  # Stores the full recipe JSON from AI
     created_at = Column(DateTime, default=datetime.utcnow)
     imported_at = Column(DateTime, default=datetime.utcnow)
 
+# Jobs that still hold the "this URL is being imported" slot
+ACTIVE_JOB = text("status IN ('queued', 'processing')")
+
 class ImportJob(Base):
     __tablename__ = "import_jobs"
+    __table_args__ = (
+        # At most one active job per post; finished/failed jobs don't block re-imports
+        Index("ux_import_jobs_active_canonical_key", "canonical_key", unique=True, sqlite_where=ACTIVE_JOB, postgresql_where=ACTIVE_JOB),
+        # DB queue scan: status = 'queued' ORDER BY created_at
+        Index("ix_import_jobs_status_created_at", "status", "created_at"),
+    )
 
     id = Column(String, primary_key=True, index=True)
     user_id = Column(String, index=True)
     source_url = Column(String)
-    status = Column(String, default="processing")  # processing, completed, failed
+    canonical_key = Column(String)
+    status = Column(String, default="processing")  # queued, processing, completed, failed
+    stage = Column(String, nullable=True)  # queued, scraping, extracting, saving, completed, failed
     error_message = Column(String, nullable=True)
-    recipe_id = Column(String, ForeignKey("recipes.id"), nullable=True)
+    recipe_id = Column(String, ForeignKey("recipes.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+
+class CacheEntry(Base):
+    """Persistent tier of app.cache.TieredCache when Redis isn't configured"""
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
+class RateLimitBucket(Base):
+    """Token bucket state for app.services.rate_limit when Redis isn't configured"""
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # epoch seconds of the last refill
+
+class RateLimitLease(Base):
+    """Held slots of an app.services.rate_limit.SharedSemaphore when Redis isn't configured"""
+    __tablename__ = "rate_limit_leases"
+
+    name = Column(String, primary_key=True)
+    lease = Column(String, primary_key=True)
+    expires_at = Column(Float, nullable=False)  # epoch seconds; expired leases are free slots
+
+class RecipeIngredient(Base):
+    """Normalized ingredient rows of Recipe.data, maintained by app/search.py"""
+    __tablename__ = "recipe_ingredients"
+
+    recipe_id = Column(String, ForeignKey("recipes.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, index=True)  # lowercased item
+    quantity = Column(String, nullable=True)
+    unit = Column(String, nullable=True)
+
+class RecipeTag(Base):
+    """Normalized tags of Recipe.data, maintained by app/search.py"""
+    __tablename__ = "recipe_tags"
+    __table_args__ = (
+        # Tag filter: tag IN (...) -> recipe ids
+        Index("ix_recipe_tags_tag_recipe_id", "tag", "recipe_id"),
+    )
+
+    recipe_id = Column(String, ForeignKey("recipes.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String, primary_key=True)  # lowercased, no leading '#'
+
+# Full-text index behind GET /recipes/search: an FTS5 table on SQLite, a
+# weighted tsvector (title A, ingredients B, tags C) with a GIN index on Postgres.
+# Not a mapped model since the shape differs per database; app/search.py writes it.
+RECIPE_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5("
+        "recipe_id UNINDEXED, title, ingredients, tags, tokenize = 'porter unicode61')",
+    ],
+    "postgresql": [
+        "CREATE TABLE IF NOT EXISTS recipe_search ("
+        "recipe_id VARCHAR PRIMARY KEY REFERENCES recipes (id) ON DELETE CASCADE, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_recipe_search_document ON recipe_search USING GIN (document)",
+    ],
+}
+for _dialect, _statements in RECIPE_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect=_dialect))
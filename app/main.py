@@ -1,28 +1,71 @@
+import asyncio
+import base64
+import hmac
+import json
 import logging
+import time
 import uuid
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+import orjson
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Union
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import func, insert, literal, null, select, tuple_, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import SessionLocal, engine, Base, Recipe, ImportJob
-from app.schemas import RecipeImportRequest, RecipeImportResponse, RecipeResponse
-from app.queue import enqueue_recipe_import
+from app.database import AsyncSessionLocal, engine, Base, Recipe, ImportJob
+from app.metrics import DB_COMMIT_SECONDS, HTTP_REQUEST_SECONDS, timed
+from app.schemas import (
+    RecipeImportRequest, RecipeImportResponse, RecipeResponse, RecipeSummary, JobStatusResponse,
+    BulkRecipeImportRequest, BulkRecipeImportResponse, BulkImportItem,
+)
+from app.queue import enqueue_recipe_import, enqueue_recipe_imports
+from app.notify import JOB_EVENTS_CHANNEL, Subscription
+from app.search import search_recipe_ids
+from app.services.apify_client import apify_client
 from app.config import get_settings
+from app.utils import canonical_url, canonical_key
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
 settings = get_settings()
 
+class RecipeGZipMiddleware(GZipMiddleware):
+    """GZip that never touches the SSE route: Starlette only skips
+    text/event-stream itself from 0.46, and a buffered stream stops being live"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/jobs/") and scope["path"].endswith("/events"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 app = FastAPI(title="Eylo Recipe Import API")
+# Recipe lists are large, repetitive JSON
+app.add_middleware(RecipeGZipMiddleware, minimum_size=1024)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.monotonic()
+    response = await call_next(request)
+    # Label by route template, not path, so /jobs/{job_id} is one series
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method,
+        route.path if route is not None else "unmatched",
+        response.status_code,
+    ).observe(time.monotonic() - started)
+    return response
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @app.get("/")
 def read_root():
@@ -32,8 +75,21 @@ def read_root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint (the worker serves its own on WORKER_METRICS_PORT)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+async def _active_job(db: AsyncSession, key: str):
+    """Queued/processing job for a canonical key (served by the partial unique index)"""
+    result = await db.execute(select(ImportJob).where(
+        ImportJob.canonical_key == key,
+        ImportJob.status.in_(["queued", "processing"])
+    ).limit(1))
+    return result.scalar_one_or_none()
+
 @app.post("/import/recipe", response_model=RecipeImportResponse)
-async def import_recipe(request: RecipeImportRequest, db: Session = Depends(get_db)):
+async def import_recipe(request: RecipeImportRequest, db: AsyncSession = Depends(get_db)):
     """
     Submit a URL for recipe extraction.
     Returns a job ID to track progress.
@@ -42,16 +98,15 @@ async def import_recipe(request: RecipeImportRequest, db: Session = Depends(get_
     # In a real app, this would come from the JWT token
     user_id = str(uuid.uuid4())
     
-    # Clean URL for Instagram/TikTok to avoid duplicates with query params
-    url_str = str(request.url)
-    if "instagram.com" in url_str or "tiktok.com" in url_str:
-        url_str = url_str.split("?")[0]
+    # One URL and dedup key per post, whatever link variant was shared
+    url_str = canonical_url(str(request.url))
+    key = canonical_key(url_str)
     
     # Check if this URL was already imported from database
-    existing_recipe = db.query(Recipe).filter(Recipe.source_url == url_str).first()
+    existing_recipe = (await db.execute(select(Recipe).where(Recipe.canonical_key == key))).scalar_one_or_none()
     if existing_recipe:
         # Return success with the existing recipe's job ID (if available)
-        existing_job = db.query(ImportJob).filter(ImportJob.recipe_id == existing_recipe.id).first()
+        existing_job = (await db.execute(select(ImportJob).where(ImportJob.recipe_id == existing_recipe.id).limit(1))).scalar_one_or_none()
         return RecipeImportResponse(
             job_id=existing_job.id if existing_job else str(uuid.uuid4()),
             status="completed",
@@ -59,10 +114,7 @@ async def import_recipe(request: RecipeImportRequest, db: Session = Depends(get_
         )
     
     # Check if there's already a pending job for this URL
-    existing_job = db.query(ImportJob).filter(
-        ImportJob.source_url == url_str,
-        ImportJob.status.in_(["queued", "processing"])
-    ).first()
+    existing_job = await _active_job(db, key)
     if existing_job:
         return RecipeImportResponse(
             job_id=existing_job.id,
@@ -76,10 +128,25 @@ async def import_recipe(request: RecipeImportRequest, db: Session = Depends(get_
         id=job_id,
         user_id=user_id,
         source_url=url_str,
-        status="queued"
+        canonical_key=key,
+        status="queued",
+        stage="queued"
     )
     db.add(import_job)
-    db.commit()
+    try:
+        with timed(DB_COMMIT_SECONDS, "import_job"):
+            await db.commit()
+    except IntegrityError:
+        # Lost the race to a concurrent submission of the same post
+        await db.rollback()
+        existing_job = await _active_job(db, key)
+        if not existing_job:
+            raise
+        return RecipeImportResponse(
+            job_id=existing_job.id,
+            status=existing_job.status,
+            message="This URL is already being processed."
+        )
 
     # 2. Now enqueue it
     await enqueue_recipe_import(
@@ -94,12 +161,288 @@ async def import_recipe(request: RecipeImportRequest, db: Session = Depends(get_
         message="Recipe import started"
     )
 
-@app.get("/recipes", response_model=List[RecipeResponse])
-def list_recipes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """List all saved recipes"""
-    recipes = db.query(Recipe).order_by(Recipe.created_at.desc()).offset(skip).limit(limit).all()
+async def _known_imports(db: AsyncSession, keys) -> dict:
+    """{canonical_key: BulkImportItem} for keys already imported or in flight, in one query"""
+    found = union_all(
+        select(Recipe.canonical_key.label("key"), literal("completed").label("status"), null().label("job_id"), Recipe.id.label("recipe_id"))
+        .where(Recipe.canonical_key.in_(keys)),
+        select(ImportJob.canonical_key, ImportJob.status, ImportJob.id, null())
+        .where(ImportJob.canonical_key.in_(keys), ImportJob.status.in_(["queued", "processing"])),
+    )
+    known = {}
+    for row in await db.execute(found):
+        # A saved recipe wins over a job that is still running for it
+        if row.key not in known or row.status == "completed":
+            known[row.key] = BulkImportItem(url="", status=row.status, job_id=row.job_id, recipe_id=row.recipe_id)
+    return known
+
+async def _insert_jobs(db: AsyncSession, rows: List[dict]) -> set:
+    """Bulk-insert job rows in one statement, skipping ones that hit the active-job
+    unique index (a concurrent import of the same post). Returns the inserted ids."""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(ImportJob).on_conflict_do_nothing()
+    else:
+        stmt = insert(ImportJob)
+    inserted = set(await db.scalars(stmt.returning(ImportJob.id), rows))
+    with timed(DB_COMMIT_SECONDS, "import_jobs"):
+        await db.commit()
+    return inserted
+
+@app.post("/import/recipes", response_model=BulkRecipeImportResponse)
+async def import_recipes(request: BulkRecipeImportRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Submit many URLs at once. Each distinct post gets one job; posts that are
+    already imported or in progress are reported instead of re-queued.
+    """
+    # Generate a dummy user ID for now (no auth yet), same as /import/recipe
+    user_id = str(uuid.uuid4())
+
+    submitted = []  # (original url, canonical key) in request order
+    urls = {}  # canonical key -> canonical url, first occurrence wins
+    for url in request.urls:
+        url_str = canonical_url(str(url))
+        key = canonical_key(url_str)
+        submitted.append((str(url), key))
+        urls.setdefault(key, url_str)
+
+    known = await _known_imports(db, list(urls))
+
+    now = datetime.utcnow()
+    rows = [
+        {"id": str(uuid.uuid4()), "user_id": user_id, "source_url": url_str, "canonical_key": key,
+         "status": "queued", "stage": "queued", "created_at": now}
+        for key, url_str in urls.items() if key not in known
+    ]
+    inserted = await _insert_jobs(db, rows) if rows else set()
+    new_jobs = [row for row in rows if row["id"] in inserted]
+    for row in new_jobs:
+        known[row["canonical_key"]] = BulkImportItem(url="", status="queued", job_id=row["id"])
+
+    if len(new_jobs) < len(rows):
+        # Lost some races to concurrent submissions: report the winners' jobs
+        known = {**await _known_imports(db, [row["canonical_key"] for row in rows if row["id"] not in inserted]), **known}
+
+    await enqueue_recipe_imports([
+        {"job_id": row["id"], "user_id": user_id, "source_url": row["source_url"]} for row in new_jobs
+    ])
+
+    return BulkRecipeImportResponse(
+        queued=len(new_jobs),
+        items=[known[key].model_copy(update={"url": url}) for url, key in submitted],
+    )
+
+@app.get(
+    "/recipes",
+    response_model=Union[List[RecipeResponse], List[RecipeSummary]],
+    responses={200: {"description": "`RecipeResponse` rows, or `RecipeSummary` rows with `view=summary` (only the requested keys with `fields=`)"}},
+)
+async def list_recipes(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    skip: int = 0,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {', '.join(RecipeSummary.model_fields)}; implies view=summary"),
+    db: AsyncSession = Depends(get_db),
+):
+    """List all saved recipes, newest first.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next
+    page (keyset pagination). `skip` is kept for old clients and ignored when a
+    cursor is given.
+
+    `view=summary` (or `fields=...`) returns `RecipeSummary` rows built from
+    just the needed columns, without loading the `data` blob into Python.
+    """
+    if view == "summary" or fields:
+        return await _list_summaries(db, cursor, limit, skip, _summary_fields(fields))
+
+    query = _page(select(Recipe), cursor, skip)
+    recipes = (await db.scalars(query.limit(limit + 1))).all()
+    if len(recipes) > limit:
+        recipes = recipes[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(recipes[-1])
     return recipes
 
+# RecipeSummary fields as SQL: counts and tags are read out of the JSON in the database
+SUMMARY_COLUMNS = {
+    "id": Recipe.id,
+    "title": Recipe.title,
+    "source_type": Recipe.source_type,
+    "created_at": Recipe.created_at,
+    "ingredient_count": func.coalesce(func.json_array_length(Recipe.data["ingredients"]), 0),
+    "tags": Recipe.data["tags"],
+}
+
+def _summary_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(SUMMARY_COLUMNS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in SUMMARY_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+async def _list_summaries(db: AsyncSession, cursor: Optional[str], limit: int, skip: int, fields: List[str]) -> Response:
+    # id/created_at are always selected: the next cursor is built from them
+    names = list(dict.fromkeys(["id", "created_at", *fields]))
+    query = _page(select(*(SUMMARY_COLUMNS[name].label(name) for name in names)), cursor, skip)
+    rows = (await db.execute(query.limit(limit + 1))).all()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+
+    # Plain columns need no model validation: serialize straight to bytes
+    items = [_summary_item(row, fields) for row in rows]
+    return Response(content=orjson.dumps(items), media_type="application/json", headers=headers)
+
+def _summary_item(row, fields: List[str]) -> dict:
+    item = {name: row._mapping[name] for name in fields}
+    if "tags" in item and item["tags"] is None:
+        item["tags"] = []
+    return item
+
+@app.get("/recipes/search", response_model=List[RecipeSummary])
+async def search_recipes(
+    q: Optional[str] = Query(None, description="Words to match in title, ingredients or tags"),
+    ingredient: List[str] = Query([], description="Ingredient that must be in the recipe (repeatable)"),
+    tag: List[str] = Query([], description="Tag the recipe must have (repeatable)"),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of the summary fields"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Search saved recipes by ingredient, tag and title, best match first"""
+    if not (q or any(ingredient) or any(tag)):
+        raise HTTPException(status_code=400, detail="Give q, ingredient or tag")
+    fields = _summary_fields(fields)
+
+    ids = await search_recipe_ids(db, q=q, ingredients=ingredient, tags=tag, limit=limit)
+    names = list(dict.fromkeys(["id", *fields]))
+    rows = {}
+    if ids:
+        query = select(*(SUMMARY_COLUMNS[name].label(name) for name in names)).where(Recipe.id.in_(ids))
+        rows = {row.id: row for row in await db.execute(query)}
+    items = [_summary_item(rows[recipe_id], fields) for recipe_id in ids if recipe_id in rows]
+    return Response(content=orjson.dumps(items), media_type="application/json")
+
+def _page(query, cursor: Optional[str], skip: int):
+    """Newest-first ordering plus the keyset (or legacy offset) position"""
+    query = query.order_by(Recipe.created_at.desc(), Recipe.id.desc())
+    if cursor:
+        created_at, recipe_id = _decode_cursor(cursor)
+        query = query.where(tuple_(Recipe.created_at, Recipe.id) < tuple_(created_at, recipe_id))
+    elif skip:
+        query = query.offset(skip)
+    return query
+
+def _encode_cursor(recipe) -> str:
+    raw = json.dumps([recipe.created_at.isoformat(), recipe.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, recipe_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), recipe_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+JOB_FINISHED = ("completed", "failed")
+
+async def _load_job_status(job_id: str) -> Optional[JobStatusResponse]:
+    async with AsyncSessionLocal() as db:
+        job = await db.get(ImportJob, job_id)
+        return JobStatusResponse.from_job(job) if job else None
+
+async def _watch_job(job_id: str, last_stage: Optional[str], timeout: float, tick: float) -> AsyncIterator[Optional[JobStatusResponse]]:
+    """Yield the job's status each time its stage differs from the last one seen.
+
+    Wakes on the agent's pub/sub events; without Redis it re-reads the row every
+    `job_poll_interval_seconds`. Yields None after each quiet wait (at most
+    `tick` seconds) and stops once the job has finished or `timeout` runs out.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # Subscribe before the first read so a transition in between isn't lost
+    async with Subscription(JOB_EVENTS_CHANNEL.format(job_id)) as events:
+        while True:
+            status = await _load_job_status(job_id)
+            if status is None:
+                return
+            if status.stage != last_stage:
+                last_stage = status.stage
+                yield status
+            if status.status in JOB_FINISHED:
+                return
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            wait = min(remaining, tick)
+            if not events.live:
+                wait = min(wait, settings.job_poll_interval_seconds)
+            if await events.get(timeout=wait) is None:
+                yield None
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Long-poll: seconds to wait for the next stage change"),
+    stage: Optional[str] = Query(None, description="Last stage the client saw (defaults to the current one)"),
+):
+    """Current status of an import job, optionally long-polling for the next change"""
+    status = await _load_job_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not wait or status.status in JOB_FINISHED or (stage and stage != status.stage):
+        return status
+
+    timeout = min(wait, settings.job_wait_max_seconds)
+    async for update in _watch_job(job_id, status.stage, timeout, tick=timeout):
+        if update is not None:
+            return update
+    return await _load_job_status(job_id) or status
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events stream of stage transitions, closed once the job finishes"""
+    if await _load_job_status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        updates = _watch_job(job_id, None, settings.job_events_max_seconds, settings.job_events_keepalive_seconds)
+        last_ping = asyncio.get_running_loop().time()
+        async for update in updates:
+            now = asyncio.get_running_loop().time()
+            if update is not None:
+                yield f"event: job\nid: {update.stage}\ndata: {update.model_dump_json()}\n\n"
+            elif now - last_ping >= settings.job_events_keepalive_seconds:
+                yield ": keepalive\n\n"
+            else:
+                continue
+            last_ping = now
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/webhooks/apify")
+async def apify_webhook(payload: dict, secret: str = ""):
+    """Receives Apify run-finished webhooks and wakes the worker waiting on that run"""
+    if settings.apify_webhook_secret and not hmac.compare_digest(secret, settings.apify_webhook_secret):
+        raise HTTPException(status_code=403, detail="Invalid webhook secret")
+
+    run = payload.get("resource") or {}
+    if not run.get("id"):
+        raise HTTPException(status_code=400, detail="Missing run resource")
+
+    await apify_client.notify_run_finished(run)
+    return {"status": "ok"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
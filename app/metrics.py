@@ -0,0 +1,88 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Seconds, for calls to the outside world (Apify, CDNs, OpenAI)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+# Seconds, for local work (DB commits, request handling)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str):
+    """Observe the block's wall time on `histogram`, labelled with `labels`
+    plus an outcome ("ok" or "error") as the last label"""
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        histogram.labels(*labels, outcome).observe(time.monotonic() - started)
+
+
+# Extraction tiers (see RecipeAgent's stages and ExtractionTool.caption_tier):
+#   text    caption-only LLM pass, no media
+#   video   frames sampled from the video + vision request
+#   images  post images + vision request
+EXTRACTION_TIER_TOTAL = Counter(
+    "eylo_extraction_tier_total",
+    "Extraction attempts by tier and outcome (accepted, escalated, skipped, failed)",
+    ["tier", "outcome"],
+)
+EXTRACTION_TIER_SECONDS = Histogram(
+    "eylo_extraction_tier_seconds",
+    "Wall time of each extraction tier, from fetching its media to the model's answer",
+    ["tier"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+EXTRACTION_TEXT_COMPLETENESS = Histogram(
+    "eylo_extraction_text_completeness",
+    "Completeness score of caption-only extractions",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+# Worker pipeline stages (see app/agent/pipeline.py)
+PIPELINE_QUEUE_DEPTH = Gauge("eylo_pipeline_queue_depth", "Items waiting for a stage", ["stage"])
+PIPELINE_IN_PROGRESS = Gauge("eylo_pipeline_in_progress", "Items a stage is working on", ["stage"])
+PIPELINE_STAGE_SECONDS = Histogram(
+    "eylo_pipeline_stage_seconds",
+    "Time an item spends in a stage's handler",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+PIPELINE_STAGE_TOTAL = Counter("eylo_pipeline_stage_total", "Stage handler runs by outcome (ok, error)", ["stage", "outcome"])
+
+# Calls the stages are made of
+TOOL_SECONDS = Histogram("eylo_tool_seconds", "Agent tool execute() wall time", ["tool", "outcome"], buckets=SLOW_BUCKETS)
+APIFY_RUN_WAIT_SECONDS = Histogram(
+    "eylo_apify_run_wait_seconds",
+    "Time from starting an Apify actor run until it finished",
+    ["platform", "outcome"],
+    buckets=SLOW_BUCKETS,
+)
+MEDIA_DOWNLOAD_SECONDS = Histogram("eylo_media_download_seconds", "Video/image download time", ["kind", "outcome"], buckets=SLOW_BUCKETS)
+MEDIA_DOWNLOAD_BYTES = Counter("eylo_media_download_bytes_total", "Bytes of media downloaded", ["kind"])
+FRAME_EXTRACTION_SECONDS = Histogram(
+    "eylo_frame_extraction_seconds",
+    "Frame sampling time in the media pool, streamed from a URL or read from a downloaded file",
+    ["source", "outcome"],
+    buckets=SLOW_BUCKETS,
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    "eylo_openai_request_seconds",
+    "Chat completion latency per attempt (ok, rate_limited, error), excluding limiter waits",
+    ["model", "outcome"],
+    buckets=SLOW_BUCKETS,
+)
+OPENAI_TOKENS_TOTAL = Counter("eylo_openai_tokens_total", "Tokens billed by OpenAI (prompt, completion)", ["model", "kind"])
+DB_COMMIT_SECONDS = Histogram("eylo_db_commit_seconds", "Transaction commit time", ["operation", "outcome"], buckets=FAST_BUCKETS)
+
+# API
+HTTP_REQUEST_SECONDS = Histogram(
+    "eylo_http_request_seconds",
+    "API response time until the response starts (streams excluded from the body time)",
+    ["method", "route", "status"],
+    buckets=FAST_BUCKETS,
+)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.database import engine, async_engine
+from app.redis_client import USE_REDIS, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Redis pub/sub channel carrying a job's stage transitions (see RecipeAgent)
+JOB_EVENTS_CHANNEL = "eylo:job:{}"
+
+# LISTEN/NOTIFY only exists on Postgres; other databases fall back to polling
+IS_POSTGRES = engine.dialect.name == "postgresql"
+
+
+async def notify(channel: str, payload: str = "") -> None:
+    """Send a NOTIFY on `channel` (no-op when not on Postgres)"""
+    if not IS_POSTGRES:
+        return
+    try:
+        async with async_engine.begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+    except Exception as e:
+        logger.warning(f"NOTIFY {channel} failed: {e}")
+
+
+class Listener:
+    """Dedicated LISTEN connection that lets a coroutine sleep until a NOTIFY arrives"""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            fairy = engine.raw_connection()
+            fairy.detach()  # keep this connection out of the pool for its whole life
+            conn = fairy.dbapi_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}"')
+            self._conn = conn
+        return self._conn
+
+    def _drain(self) -> bool:
+        """Consume pending notifications, returning True if there were any"""
+        self._conn.poll()
+        received = bool(self._conn.notifies)
+        self._conn.notifies.clear()
+        return received
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a notification. Returns True if one arrived."""
+        try:
+            conn = self._connect()
+            if self._drain():
+                return True
+        except Exception as e:
+            logger.warning(f"LISTEN {self.channel} unavailable: {e}")
+            self.close()
+            await asyncio.sleep(timeout)
+            return False
+
+        loop = asyncio.get_running_loop()
+        ready: asyncio.Future = loop.create_future()
+        fd = conn.fileno()
+        try:
+            loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        except NotImplementedError:
+            # Event loops without add_reader (e.g. Windows Proactor): plain sleep
+            await asyncio.sleep(timeout)
+            return self._drain()
+
+        try:
+            await asyncio.wait_for(ready, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(fd)
+
+        try:
+            return self._drain()
+        except Exception as e:
+            logger.warning(f"LISTEN {self.channel} connection lost: {e}")
+            self.close()
+            return False
+
+
+_listeners: dict[str, Listener] = {}
+
+
+def get_listener(channel: str) -> Optional[Listener]:
+    """Per-process listener for `channel`, or None when notifications are unsupported"""
+    if not IS_POSTGRES:
+        return None
+    if channel not in _listeners:
+        _listeners[channel] = Listener(channel)
+    return _listeners[channel]
+
+
+async def publish_event(channel: str, payload: dict) -> None:
+    """Publish `payload` to subscribers of `channel` across processes (Redis pub/sub)"""
+    if not (USE_REDIS and redis_client):
+        return
+    try:
+        await redis_client.publish(channel, json.dumps(payload))
+    except Exception as e:
+        logger.warning(f"Publish to {channel} failed: {e}")
+
+
+class Subscription:
+    """Async context manager receiving events published with `publish_event`.
+
+    Without Redis there is nobody to deliver events, so `get` just waits out
+    its timeout and callers fall back to polling.
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._pubsub = None
+
+    async def __aenter__(self):
+        if USE_REDIS and redis_client:
+            try:
+                self._pubsub = redis_client.pubsub()
+                await self._pubsub.subscribe(self.channel)
+            except Exception as e:
+                logger.warning(f"Subscribe to {self.channel} failed: {e}")
+                self._pubsub = None
+        return self
+
+    @property
+    def live(self) -> bool:
+        """True while events are actually being delivered (callers can poll less)"""
+        return self._pubsub is not None
+
+    async def __aexit__(self, *exc):
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.channel)
+                await self._pubsub.aclose()
+            except Exception:
+                pass
+            self._pubsub = None
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event within `timeout` seconds, or None"""
+        if self._pubsub is None:
+            await asyncio.sleep(timeout)
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            except Exception as e:
+                logger.warning(f"Subscription to {self.channel} lost: {e}")
+                self._pubsub = None
+                await asyncio.sleep(max(0.0, deadline - loop.time()))
+                return None
+            if message and message.get("type") == "message":
+                try:
+                    return json.loads(message["data"])
+                except ValueError:
+                    return {}
@@ -1,72 +1,269 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List
+import asyncio
 import json
+import logging
+import os
+import socket
 import time
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, ImportJob
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import select, update
+from app.database import AsyncSessionLocal, ImportJob
 from app.config import get_settings
+from app.metrics import DB_COMMIT_SECONDS, timed
+from app.notify import JOB_EVENTS_CHANNEL, notify, get_listener, publish_event
+from app.redis_client import USE_REDIS, redis_client
+from app.schemas import JobStatusResponse
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
 RECIPE_QUEUE = "eylo:recipe_import"
+# Postgres NOTIFY channel used to wake DB-queue workers when a job is inserted
+RECIPE_QUEUE_CHANNEL = "eylo_recipe_import"
 
-# Check for Redis availability
-USE_REDIS = not settings.redis_url.startswith("memory://")
-if USE_REDIS:
-    try:
-        import redis
-        redis_client = redis.from_url(settings.redis_url, decode_responses=True)
-        redis_client.ping()
-    except Exception:
-        print("⚠️ Redis unavailable, using DB queue")
-        USE_REDIS = False
-else:
-    redis_client = None
+# Reliable Redis queue layout:
+#   RECIPE_QUEUE                 pending jobs (LPUSH in, popped from the right)
+#   PROCESSING_KEY.format(id)    jobs a worker has claimed but not acked yet
+#   HEARTBEAT_KEY.format(id)     worker liveness, expires after the visibility timeout
+#   WORKERS_KEY                  every worker id that may own a processing list
+#   DELIVERIES_KEY               how many times each unacked job was handed out
+#   DEAD_LETTER_QUEUE            jobs that kept killing workers
+PROCESSING_KEY = "eylo:recipe_import:processing:{}"
+HEARTBEAT_KEY = "eylo:recipe_import:heartbeat:{}"
+WORKERS_KEY = "eylo:recipe_import:workers"
+DELIVERIES_KEY = "eylo:recipe_import:deliveries"
+DEAD_LETTER_QUEUE = "eylo:recipe_import:dead"
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Raw queue payloads of the jobs this process has claimed, keyed by job_id (needed to ack)
+_claimed: Dict[str, str] = {}
 
 async def enqueue_recipe_import(job_id: str, user_id: str, source_url: str) -> str:
     """Add a recipe import job to the queue"""
-    job_data = {
-        "job_id": job_id,
-        "user_id": user_id,
-        "source_url": source_url,
-        "created_at": time.time()
-    }
-    
-    if USE_REDIS and redis_client:
-        redis_client.lpush(RECIPE_QUEUE, json.dumps(job_data))
-    
-    # If using DB Queue (no Redis), the job is already inserted in 'queued' status by main.py
-    # so we don't need to do anything here.
-    
+    await enqueue_recipe_imports([{"job_id": job_id, "user_id": user_id, "source_url": source_url}])
     return job_id
 
-def dequeue_recipe_import() -> Optional[Dict[str, Any]]:
-    """Get next job from queue"""
+async def enqueue_recipe_imports(jobs: List[Dict[str, Any]]) -> None:
+    """Add many jobs ({job_id, user_id, source_url}) in one round trip"""
+    if not jobs:
+        return
+    now = time.time()
+    payloads = [json.dumps({**job, "created_at": now}) for job in jobs]
+
     if USE_REDIS and redis_client:
-        item = redis_client.rpop(RECIPE_QUEUE)
-        return json.loads(item) if item else None
-    
-    # DB Polling Queue
-    db: Session = SessionLocal()
+        # LPUSH takes many values: the whole batch lands in one command, oldest popped first
+        await redis_client.lpush(RECIPE_QUEUE, *payloads)
+    else:
+        # DB Queue: the jobs are already inserted in 'queued' status by main.py,
+        # just wake up any idle workers.
+        await notify(RECIPE_QUEUE_CHANNEL, jobs[0]["job_id"] if len(jobs) == 1 else "")
+
+async def claim_recipe_imports(limit: int = 1) -> List[Dict[str, Any]]:
+    """Atomically claim up to `limit` queued jobs from the DB queue.
+
+    A single UPDATE ... WHERE id IN (oldest queued) RETURNING flips the jobs
+    to 'processing', so two workers can never claim the same row. On Postgres
+    the inner select uses FOR UPDATE SKIP LOCKED so concurrent claimers skip
+    each other's rows instead of blocking; SQLite serializes writers anyway.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            candidates = (
+                select(ImportJob.id)
+                .where(ImportJob.status == "queued")
+                .order_by(ImportJob.created_at.asc())
+                .limit(limit)
+            )
+            if db.get_bind().dialect.name == "postgresql":
+                candidates = candidates.with_for_update(skip_locked=True)
+
+            stmt = (
+                update(ImportJob)
+                .where(ImportJob.id.in_(candidates.scalar_subquery()), ImportJob.status == "queued")
+                .values(status="processing")
+                .returning(ImportJob.id, ImportJob.user_id, ImportJob.source_url, ImportJob.created_at)
+                .execution_options(synchronize_session=False)
+            )
+            rows = (await db.execute(stmt)).all()
+            with timed(DB_COMMIT_SECONDS, "claim_jobs"):
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error polling DB queue: {e}")
+            return []
+
+    rows.sort(key=lambda r: r.created_at or datetime.min)
+    return [
+        {
+            "job_id": r.id,
+            "user_id": r.user_id,
+            "source_url": r.source_url,
+            "created_at": r.created_at.timestamp() if r.created_at else time.time()
+        }
+        for r in rows
+    ]
+
+async def dequeue_recipe_imports(limit: int = 1, timeout: float = None) -> List[Dict[str, Any]]:
+    """Get up to `limit` jobs from the queue, waiting up to `timeout` seconds for work"""
+    timeout = settings.queue_wait_seconds if timeout is None else timeout
+
+    if USE_REDIS and redis_client:
+        return await _dequeue_redis(limit, timeout)
+
+    # DB Queue
+    jobs = await claim_recipe_imports(limit)
+    if jobs:
+        return jobs
+
+    listener = get_listener(RECIPE_QUEUE_CHANNEL)
+    if listener:
+        # Postgres: sleep until main.py NOTIFYs about a new job (or timeout)
+        await listener.wait(timeout)
+        return await claim_recipe_imports(limit)
+
+    # No notifications available (SQLite): poll within the timeout window
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(min(settings.queue_poll_interval_seconds, max(0.0, deadline - time.monotonic())))
+        jobs = await claim_recipe_imports(limit)
+        if jobs:
+            return jobs
+    return []
+
+
+async def _dequeue_redis(limit: int, timeout: float) -> List[Dict[str, Any]]:
+    """Blocking move from the pending list into this worker's processing list"""
+    processing = PROCESSING_KEY.format(WORKER_ID)
+    await heartbeat()
+
+    raw = await redis_client.blmove(RECIPE_QUEUE, processing, timeout, "RIGHT", "LEFT")
+    if raw is None:
+        return []
+    items = [raw]
+    while len(items) < limit:
+        raw = await redis_client.lmove(RECIPE_QUEUE, processing, "RIGHT", "LEFT")
+        if raw is None:
+            break
+        items.append(raw)
+
+    jobs = []
+    for raw in items:
+        try:
+            job = json.loads(raw)
+        except ValueError:
+            logger.error(f"Dropping malformed queue item: {raw!r}")
+            await redis_client.lrem(processing, 1, raw)
+            continue
+
+        deliveries = await redis_client.hincrby(DELIVERIES_KEY, job["job_id"], 1)
+        if deliveries > settings.retry_attempts:
+            # Poison job: it keeps dying together with its worker, park it for inspection
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.lrem(processing, 1, raw)
+                pipe.lpush(DEAD_LETTER_QUEUE, raw)
+                pipe.hdel(DELIVERIES_KEY, job["job_id"])
+                await pipe.execute()
+            logger.error(f"Job {job['job_id']} moved to {DEAD_LETTER_QUEUE} after {deliveries - 1} deliveries")
+            await _fail_dead_job(job["job_id"], deliveries - 1)
+            continue
+
+        _claimed[job["job_id"]] = raw
+        jobs.append(job)
+    return jobs
+
+async def _fail_dead_job(job_id: str, deliveries: int) -> None:
+    """Finish a dead-lettered job's row, so GET /jobs/{id} ends and the URL can be imported again"""
     try:
-        # Transactional fetch: find oldest queued job and lock it/mark as processing
-        # Simple implementation: fetch first, then update. 
-        # For higher concurrency, consider SELECT FOR UPDATE.
-        job = db.query(ImportJob).filter(ImportJob.status == "queued").order_by(ImportJob.created_at.asc()).first()
-        
-        if job:
-            job.status = "processing"
-            db.commit()
-            
-            return {
-                "job_id": job.id,
-                "user_id": job.user_id,
-                "source_url": job.source_url,
-                "created_at": job.created_at.timestamp() if job.created_at else time.time()
-            }
-            
-        return None
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ImportJob, job_id)
+            if job is None or job.status not in ("queued", "processing"):
+                return
+            job.status = "failed"
+            job.stage = "failed"
+            job.error_message = f"Job crashed its worker {deliveries} times and was moved to the dead-letter queue"
+            job.completed_at = datetime.now(timezone.utc)
+            await db.commit()
+            event = JobStatusResponse.from_job(job).model_dump(mode="json")
+        await publish_event(JOB_EVENTS_CHANNEL.format(job_id), event)
     except Exception as e:
-        print(f"Error polling DB queue: {e}")
-        return None
-    finally:
-        db.close()
+        logger.error(f"Could not mark dead-lettered job {job_id} failed: {e}")
+
+async def ack_recipe_import(job_data: Dict[str, Any]) -> None:
+    """Mark a claimed job as done so it is never redelivered.
+
+    Only needed for the Redis queue; DB-queue jobs are finished by the agent
+    updating the ImportJob row.
+    """
+    raw = _claimed.pop(job_data["job_id"], None)
+    if not (USE_REDIS and redis_client) or raw is None:
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.lrem(PROCESSING_KEY.format(WORKER_ID), 1, raw)
+        pipe.hdel(DELIVERIES_KEY, job_data["job_id"])
+        await pipe.execute()
+
+async def heartbeat() -> None:
+    """Refresh this worker's lease on everything in its processing list"""
+    if not (USE_REDIS and redis_client):
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.sadd(WORKERS_KEY, WORKER_ID)
+        pipe.set(HEARTBEAT_KEY.format(WORKER_ID), int(time.time()), ex=settings.queue_visibility_timeout_seconds)
+        await pipe.execute()
+
+async def _requeue_processing(worker_id: str) -> int:
+    """Move every job left in `worker_id`'s processing list back onto the queue"""
+    processing = PROCESSING_KEY.format(worker_id)
+    moved = 0
+    # RIGHT end of RECIPE_QUEUE is the next to be consumed, so recovered jobs go first
+    while await redis_client.lmove(processing, RECIPE_QUEUE, "RIGHT", "RIGHT") is not None:
+        moved += 1
+    return moved
+
+async def reap_expired() -> int:
+    """Requeue jobs held by workers whose heartbeat expired (visibility timeout)"""
+    if not (USE_REDIS and redis_client):
+        return 0
+    requeued = 0
+    for worker_id in await redis_client.smembers(WORKERS_KEY):
+        if worker_id == WORKER_ID or await redis_client.exists(HEARTBEAT_KEY.format(worker_id)):
+            continue
+        count = await _requeue_processing(worker_id)
+        await redis_client.srem(WORKERS_KEY, worker_id)
+        if count:
+            logger.warning(f"Requeued {count} job(s) from dead worker {worker_id}")
+        requeued += count
+    return requeued
+
+async def run_queue_maintenance() -> None:
+    """Background loop: keep this worker's lease alive and recover jobs from dead workers"""
+    if not (USE_REDIS and redis_client):
+        return
+    while True:
+        try:
+            await heartbeat()
+            await reap_expired()
+        except Exception as e:
+            logger.error(f"Queue maintenance error: {e}")
+        await asyncio.sleep(settings.queue_heartbeat_seconds)
+
+async def release_worker() -> None:
+    """On shutdown: hand unfinished jobs back to the queue and deregister this worker"""
+    if not (USE_REDIS and redis_client):
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        # A clean handback is not a failed delivery
+        for job_id in _claimed:
+            pipe.hincrby(DELIVERIES_KEY, job_id, -1)
+        await pipe.execute()
+    _claimed.clear()
+
+    count = await _requeue_processing(WORKER_ID)
+    if count:
+        logger.info(f"Returned {count} unfinished job(s) to the queue")
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.srem(WORKERS_KEY, WORKER_ID)
+        pipe.delete(HEARTBEAT_KEY.format(WORKER_ID))
+        await pipe.execute()
@@ -0,0 +1,18 @@
+from app.config import get_settings
+
+settings = get_settings()
+
+# Check for Redis availability
+USE_REDIS = not settings.redis_url.startswith("memory://")
+redis_client = None
+if USE_REDIS:
+    try:
+        import redis
+        import redis.asyncio
+
+        # One-off synchronous ping at startup; all runtime calls go through the async client
+        redis.from_url(settings.redis_url, socket_connect_timeout=2).ping()
+        redis_client = redis.asyncio.from_url(settings.redis_url, decode_responses=True)
+    except Exception:
+        print("⚠️ Redis unavailable, using DB queue")
+        USE_REDIS = False
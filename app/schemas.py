@@ -27,6 +27,25 @@ class RecipeImportRequest(BaseModel):
 
 
 
+class BulkRecipeImportRequest(BaseModel):
+    """Request to import many URLs at once (e.g. a saved-posts collection)"""
+    urls: List[HttpUrl] = Field(..., min_length=1, max_length=500, description="Instagram/TikTok/YouTube URLs")
+
+
+class BulkImportItem(BaseModel):
+    """Outcome for one submitted URL"""
+    url: str
+    status: str = Field(..., description="queued, processing, or completed (already imported)")
+    job_id: Optional[str] = None
+    recipe_id: Optional[str] = None
+
+
+class BulkRecipeImportResponse(BaseModel):
+    """Response after enqueueing a bulk import"""
+    queued: int = Field(..., description="Number of new jobs created")
+    items: List[BulkImportItem]
+
+
 class RecipeImportResponse(BaseModel):
     """Response after enqueueing recipe import job"""
     job_id: UUID
@@ -34,6 +53,29 @@ class RecipeImportResponse(BaseModel):
     message: str = "Recipe import started. You'll receive a notification when it's ready."
 
 
+class JobStatusResponse(BaseModel):
+    """Progress of a recipe import job"""
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    recipe_id: Optional[str] = None
+    error_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    @classmethod
+    def from_job(cls, job) -> "JobStatusResponse":
+        return cls(
+            job_id=job.id,
+            status=job.status,
+            stage=job.stage or job.status,
+            recipe_id=job.recipe_id,
+            error_message=job.error_message,
+            created_at=job.created_at,
+            completed_at=job.completed_at,
+        )
+
+
 class RecipeResponse(BaseModel):
     """Complete recipe response"""
     id: str
@@ -49,6 +91,16 @@ class RecipeResponse(BaseModel):
         from_attributes = True
 
 
+class RecipeSummary(BaseModel):
+    """List-view projection of a recipe (GET /recipes?view=summary)"""
+    id: str
+    title: str
+    source_type: str
+    created_at: datetime
+    ingredient_count: int = 0
+    tags: List[str] = Field(default_factory=list)
+
+
 class ScrapedContent(BaseModel):
     """Data returned from Apify scraper"""
     video_url: Optional[str] = Field(None, description="Direct link to video MP4")
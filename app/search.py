@@ -0,0 +1,203 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from sqlalchemy import column, delete, func, insert, literal_column, or_, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, Recipe, RecipeIngredient, RecipeTag
+
+logger = logging.getLogger(__name__)
+
+# Postgres text search configuration (SQLite's FTS5 table uses the porter tokenizer)
+TS_CONFIG = "english"
+
+recipe_search = table("recipe_search", column("recipe_id"), column("document"))
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.strip().lstrip("#").strip().lower()
+
+
+def _ingredients(data: dict) -> List[dict]:
+    rows = []
+    for position, ingredient in enumerate(data.get("ingredients") or []):
+        name = str((ingredient or {}).get("item") or "").strip().lower()
+        if not name:
+            continue
+        quantity = ingredient.get("quantity")
+        rows.append({
+            "position": position,
+            "name": name,
+            "quantity": None if quantity is None else str(quantity),
+            "unit": ingredient.get("unit") or None,
+        })
+    return rows
+
+
+def _tags(data: dict) -> List[str]:
+    return list(dict.fromkeys(t for t in (normalize_tag(str(tag)) for tag in data.get("tags") or []) if t))
+
+
+async def index_recipe(db: AsyncSession, recipe: Recipe) -> None:
+    """(Re)write the ingredient, tag and full-text rows for one recipe. The caller commits."""
+    data = recipe.data or {}
+    ingredients = _ingredients(data)
+    tags = _tags(data)
+
+    await db.execute(delete(RecipeIngredient).where(RecipeIngredient.recipe_id == recipe.id))
+    await db.execute(delete(RecipeTag).where(RecipeTag.recipe_id == recipe.id))
+    if ingredients:
+        await db.execute(insert(RecipeIngredient), [{"recipe_id": recipe.id, **row} for row in ingredients])
+    if tags:
+        await db.execute(insert(RecipeTag), [{"recipe_id": recipe.id, "tag": tag} for tag in tags])
+
+    document = {
+        "recipe_id": recipe.id,
+        "title": recipe.title or "",
+        "ingredients": " ".join(row["name"] for row in ingredients),
+        "tags": " ".join(tags),
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        await db.execute(text("DELETE FROM recipe_search WHERE recipe_id = :recipe_id"), document)
+        await db.execute(text(
+            "INSERT INTO recipe_search (recipe_id, title, ingredients, tags) "
+            "VALUES (:recipe_id, :title, :ingredients, :tags)"
+        ), document)
+    elif dialect == "postgresql":
+        await db.execute(text(
+            "INSERT INTO recipe_search (recipe_id, document) VALUES (:recipe_id, "
+            f"setweight(to_tsvector('{TS_CONFIG}', :title), 'A') || "
+            f"setweight(to_tsvector('{TS_CONFIG}', :ingredients), 'B') || "
+            f"setweight(to_tsvector('{TS_CONFIG}', :tags), 'C')) "
+            "ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document"
+        ), document)
+
+
+def _fts5_phrase(term: str) -> str:
+    """Quote user input as an FTS5 string so operators/punctuation in it are inert"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _like_match(q: str, ingredients: List[str]):
+    """Portable fallback for databases without a full-text index: substring
+    matches on the title and the ingredient/tag tables, newest first"""
+    def with_ingredient(pattern):
+        return Recipe.id.in_(select(RecipeIngredient.recipe_id).where(RecipeIngredient.name.like(pattern, escape="\\")))
+
+    query = select(Recipe.id)
+    for word in q.split():
+        pattern = _like_pattern(word)
+        query = query.where(or_(
+            func.lower(Recipe.title).like(pattern, escape="\\"),
+            with_ingredient(pattern),
+            Recipe.id.in_(select(RecipeTag.recipe_id).where(RecipeTag.tag.like(pattern, escape="\\"))),
+        ))
+    for ingredient in ingredients:
+        query = query.where(with_ingredient(_like_pattern(ingredient)))
+    return query.order_by(Recipe.created_at.desc(), Recipe.id.desc())
+
+
+async def search_recipe_ids(
+    db: AsyncSession,
+    q: Optional[str] = None,
+    ingredients: List[str] = (),
+    tags: List[str] = (),
+    limit: int = 20,
+) -> List[str]:
+    """Ids of recipes matching every criterion, best match first.
+
+    `q` matches title, ingredients and tags; each of `ingredients` must appear in
+    the ingredient list (stemmed, so "chickpea" finds "canned chickpeas"); each
+    of `tags` must be an exact (normalized) tag. Without text criteria results
+    are newest first. Databases other than Postgres and SQLite get plain
+    substring matching (see `_like_match`).
+    """
+    ingredients = [i.strip() for i in ingredients if i.strip()]
+    tags = list(dict.fromkeys(t for t in map(normalize_tag, tags) if t))
+    q = (q or "").strip()
+
+    tag_filter = None
+    if tags:
+        tag_filter = (
+            select(RecipeTag.recipe_id)
+            .where(RecipeTag.tag.in_(tags))
+            .group_by(RecipeTag.recipe_id)
+            .having(func.count() == len(tags))
+        )
+
+    if not (q or ingredients):
+        query = select(Recipe.id).order_by(Recipe.created_at.desc(), Recipe.id.desc())
+        if tag_filter is not None:
+            query = query.where(Recipe.id.in_(tag_filter))
+        return list((await db.scalars(query.limit(limit))).all())
+
+    recipe_id = recipe_search.c.recipe_id
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        clauses = []
+        if q:
+            clauses.append(" ".join(_fts5_phrase(word) for word in q.split()))
+        clauses += [f"ingredients : {_fts5_phrase(i)}" for i in ingredients]
+        expression = " AND ".join(f"({c})" for c in clauses)
+        query = (
+            select(recipe_id)
+            .select_from(recipe_search)
+            .where(text("recipe_search MATCH :expression").bindparams(expression=expression))
+            .order_by(text("rank"))
+        )
+    elif dialect == "postgresql":
+        document = recipe_search.c.document
+        query = select(recipe_id).select_from(recipe_search)
+        rank = None
+        if q:
+            tsquery = func.plainto_tsquery(TS_CONFIG, q)
+            query = query.where(document.op("@@")(tsquery))
+            rank = func.ts_rank(document, tsquery)
+        for ingredient in ingredients:
+            tsquery = func.phraseto_tsquery(TS_CONFIG, ingredient)
+            # First clause uses the GIN index, ts_filter keeps only ingredient (weight B) lexemes
+            query = query.where(
+                document.op("@@")(tsquery),
+                func.ts_filter(document, literal_column("'{b}'")).op("@@")(tsquery),
+            )
+            rank = rank if rank is not None else func.ts_rank(document, tsquery)
+        query = query.order_by(rank.desc())
+    else:
+        recipe_id = Recipe.id
+        query = _like_match(q, ingredients)
+
+    if tag_filter is not None:
+        query = query.where(recipe_id.in_(tag_filter))
+    return list((await db.scalars(query.limit(limit))).all())
+
+
+async def backfill(batch_size: int = 200) -> int:
+    """Index every stored recipe (run once after deploying the search tables)"""
+    indexed = 0
+    last_id = None
+    while True:
+        async with AsyncSessionLocal() as db:
+            query = select(Recipe).order_by(Recipe.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(Recipe.id > last_id)
+            recipes = (await db.scalars(query)).all()
+            if not recipes:
+                return indexed
+            for recipe in recipes:
+                await index_recipe(db, recipe)
+            await db.commit()
+        indexed += len(recipes)
+        last_id = recipes[-1].id
+        logger.info(f"Indexed {indexed} recipes")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Indexed {asyncio.run(backfill())} recipes")
@@ -1,65 +1,219 @@
 import asyncio
+import base64
+import json
+import random
+import time
+from urllib.parse import urlencode
 import httpx
 import logging
 from app.config import get_settings
+from app.metrics import APIFY_RUN_WAIT_SECONDS, timed
+from app.notify import Subscription, publish_event
 from app.schemas import ScrapedContent
+from app.services.http_client import get_http_client
+from app.services.rate_limit import APIFY_RUN_LEASE_MARGIN_SECONDS, apify_runs, retry_after_seconds
+from app.utils import canonical_key
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-BASE_URL = "https://api.apify.com/v2"
+BASE_URL = settings.apify_base_url.rstrip("/")
 TOKEN = settings.apify_api_token
 
+# Pub/sub channel the webhook receiver (POST /webhooks/apify) signals when a run finishes
+RUN_FINISHED_CHANNEL = "eylo:apify:run:{}"
+TERMINAL_EVENTS = ["ACTOR.RUN.SUCCEEDED", "ACTOR.RUN.FAILED", "ACTOR.RUN.ABORTED", "ACTOR.RUN.TIMED_OUT"]
+
 ACTORS = {
     "instagram": "shu8hvrXbJbY3Eb9W",
     "tiktok": "OtzYfK1ndEGdwWFKQ",
 }
 
+# Both actors accept a list of URLs, so one run can serve a whole batch of jobs
 ACTOR_INPUTS = {
-    "instagram": lambda url: {"directUrls": [url], "resultsType": "details", "resultsLimit": 1, "addParentData": False},
-    "tiktok": lambda url: {"postURLs": [url], "shouldDownloadVideos": True, "shouldDownloadCovers": False, "shouldDownloadSubtitles": False, "shouldDownloadSlideshowImages": False},
+    "instagram": lambda urls: {"directUrls": urls, "resultsType": "details", "resultsLimit": 1, "addParentData": False},
+    "tiktok": lambda urls: {"postURLs": urls, "shouldDownloadVideos": True, "shouldDownloadCovers": False, "shouldDownloadSubtitles": False, "shouldDownloadSlideshowImages": False},
 }
 
+# Dataset item fields that point back at the submitted post
+ITEM_URL_FIELDS = ["inputUrl", "url", "submittedVideoUrl", "webVideoUrl"]
+ITEM_ID_FIELDS = ["shortCode", "id"]
+
 
 class ApifyClient:
+    """Apify scraper. Concurrent requests per platform are batched into one actor run."""
+
+    def __init__(self):
+        self._pending: dict[str, dict[str, list[asyncio.Future]]] = {}
+        self._flush_timers: dict[str, asyncio.Task] = {}
+        self._batches: set[asyncio.Task] = set()  # strong refs: the loop only keeps weak ones
+
     async def scrape_url(self, url: str, platform: str) -> ScrapedContent:
+        """Scrape a single post, sharing an actor run with other URLs queued in the same window"""
+        if settings.apify_batch_max_size <= 1:
+            result = (await self.scrape_urls([url], platform))[url]
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(platform, {})
+        pending.setdefault(url, []).append(future)
+        if len(pending) >= settings.apify_batch_max_size:
+            self._flush(platform)
+        elif platform not in self._flush_timers:
+            self._flush_timers[platform] = asyncio.create_task(self._flush_later(platform))
+        return await future
+
+    async def _flush_later(self, platform: str):
+        await asyncio.sleep(settings.apify_batch_window_seconds)
+        self._flush_timers.pop(platform, None)
+        self._flush(platform)
+
+    def _flush(self, platform: str):
+        """Start one actor run for everything pending on `platform`"""
+        timer = self._flush_timers.pop(platform, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        batch = self._pending.pop(platform, None)
+        if batch:
+            task = asyncio.create_task(self._run_batch(platform, batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, platform: str, batch: dict[str, list[asyncio.Future]]):
+        try:
+            results = await self.scrape_urls(list(batch), platform)
+        except Exception as e:
+            results = {url: e for url in batch}
+        for url, futures in batch.items():
+            for future in futures:
+                if future.done():
+                    continue  # waiter was cancelled
+                if isinstance(results[url], Exception):
+                    future.set_exception(results[url])
+                else:
+                    future.set_result(results[url])
+
+    async def scrape_urls(self, urls: list[str], platform: str) -> dict[str, ScrapedContent | Exception]:
+        """Scrape several posts with a single actor run.
+
+        Returns a result per input URL: the parsed content, or the exception
+        for URLs Apify returned nothing (or an error item) for.
+        """
         actor_id = ACTORS[platform]
-        run_input = ACTOR_INPUTS[platform](url)
+        run_input = ACTOR_INPUTS[platform](urls)
+
+        client = get_http_client("apify")
+        # Bigger batches take longer: don't fail all of them on the single-URL deadline
+        max_wait = settings.apify_max_wait_seconds + settings.apify_max_wait_per_url_seconds * (len(urls) - 1)
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            # Start run
-            resp = await client.post(f"{BASE_URL}/acts/{actor_id}/runs", params={"token": TOKEN}, json=run_input)
+        # Account-wide cap on concurrent runs (shared by all workers), leased for as long as we may wait
+        async with apify_runs.hold(lease_seconds=max_wait + APIFY_RUN_LEASE_MARGIN_SECONDS):
+            # Start run (with an ad-hoc completion webhook when we have a public receiver)
+            params = {"token": TOKEN}
+            if settings.apify_webhook_url:
+                params["webhooks"] = self._webhooks_param()
+            resp = await self._request(client, "POST", f"{BASE_URL}/acts/{actor_id}/runs", params=params, json=run_input)
             resp.raise_for_status()
             run_id = resp.json()["data"]["id"]
-            logger.info(f"Apify run {run_id} started for {platform}")
-
-            # Poll until done
-            dataset_id = await self._wait(client, run_id)
-
-            # Fetch results
-            items = (await client.get(f"{BASE_URL}/datasets/{dataset_id}/items", params={"token": TOKEN})).json()
-            if not items:
-                raise Exception(f"No data returned from Apify for {url}")
-
-            return self._parse(items[0], platform)
-
-    async def _wait(self, client: httpx.AsyncClient, run_id: str, max_wait: int = 180) -> str:
-        for _ in range(max_wait // 5):
-            data = (await client.get(f"{BASE_URL}/actor-runs/{run_id}", params={"token": TOKEN})).json()["data"]
-            if data["status"] == "SUCCEEDED":
-                return data["defaultDatasetId"]
-            if data["status"] in ["FAILED", "ABORTED", "TIMED-OUT"]:
-                raise Exception(f"Apify run failed: {data['status']}")
-            await asyncio.sleep(5)
+            logger.info(f"Apify run {run_id} started for {platform} ({len(urls)} URL(s))")
+
+            # Wait for the webhook signal (or poll) until done
+            with timed(APIFY_RUN_WAIT_SECONDS, platform):
+                dataset_id = await self._wait(client, run_id, max_wait)
+
+        # Fetch results and fan them back out to the submitted URLs
+        items = (await self._request(client, "GET", f"{BASE_URL}/datasets/{dataset_id}/items", params={"token": TOKEN})).json()
+        return self._assign(items or [], urls, platform)
+
+    async def _request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        """HTTP call that waits out Apify's 429s (honouring Retry-After) instead of failing the batch"""
+        for attempt in range(1, settings.retry_attempts + 2):
+            resp = await client.request(method, url, **kwargs)
+            if resp.status_code != 429 or attempt > settings.retry_attempts:
+                return resp
+            delay = retry_after_seconds(resp.headers) or min(2 ** attempt * 0.5, 30.0) * (0.5 + random.random())
+            logger.warning(f"Apify rate limited on {method} {url.split('?')[0]}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        return resp
+
+    def _assign(self, items: list[dict], urls: list[str], platform: str) -> dict[str, ScrapedContent | Exception]:
+        by_key = {}
+        for item in items:
+            keys = [canonical_key(item[f]) for f in ITEM_URL_FIELDS if isinstance(item.get(f), str)]
+            keys += [f"{platform}:{item[f]}" for f in ITEM_ID_FIELDS if item.get(f)]
+            for key in keys:
+                by_key.setdefault(key, item)
+
+        results = {}
+        for url in urls:
+            item = by_key.get(canonical_key(url))
+            if item is None and len(urls) == 1 and items:
+                item = items[0]  # single-URL run: the only item is ours even if its URL was rewritten
+            if item is None:
+                results[url] = Exception(f"No data returned from Apify for {url}")
+                continue
+            try:
+                results[url] = self._parse(item, platform)
+            except Exception as e:
+                results[url] = e
+        return results
+
+    async def _wait(self, client: httpx.AsyncClient, run_id: str, max_wait: int = None) -> str:
+        """Wait for a run to finish and return its dataset id.
+
+        Polls with adaptive backoff (fast at first, slower for long runs). When
+        webhooks are enabled, a finish event wakes us up immediately and the
+        polling only acts as a safety net for lost webhooks.
+        """
+        max_wait = settings.apify_max_wait_seconds if max_wait is None else max_wait
+        max_delay = settings.apify_webhook_poll_max_seconds if settings.apify_webhook_url else settings.apify_poll_max_seconds
+        deadline = time.monotonic() + max_wait
+        delay = settings.apify_poll_initial_seconds
+
+        # Subscribe before the first poll so a webhook can't slip in between
+        async with Subscription(RUN_FINISHED_CHANNEL.format(run_id)) as finished:
+            while True:
+                data = (await self._request(client, "GET", f"{BASE_URL}/actor-runs/{run_id}", params={"token": TOKEN})).json()["data"]
+                if data["status"] == "SUCCEEDED":
+                    return data["defaultDatasetId"]
+                if data["status"] in ["FAILED", "ABORTED", "TIMED-OUT"]:
+                    raise Exception(f"Apify run failed: {data['status']}")
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if settings.apify_webhook_url:
+                    if await finished.get(min(delay, remaining)) is not None:
+                        continue  # re-read the run so the API stays the source of truth
+                else:
+                    await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * 1.5, max_delay)
         raise TimeoutError(f"Apify run {run_id} timed out")
 
+    def _webhooks_param(self) -> str:
+        """Base64 JSON for the `webhooks` run option, pointing Apify at our receiver"""
+        request_url = settings.apify_webhook_url
+        if settings.apify_webhook_secret:
+            request_url += ("&" if "?" in request_url else "?") + urlencode({"secret": settings.apify_webhook_secret})
+        webhooks = [{"eventTypes": TERMINAL_EVENTS, "requestUrl": request_url}]
+        return base64.b64encode(json.dumps(webhooks).encode()).decode()
+
+    async def notify_run_finished(self, run: dict):
+        """Called by the webhook receiver: wake whoever is waiting on this run"""
+        await publish_event(RUN_FINISHED_CHANNEL.format(run["id"]), {
+            "run_id": run["id"],
+            "status": run.get("status"),
+            "dataset_id": run.get("defaultDatasetId"),
+        })
+
     def _parse(self, item: dict, platform: str) -> ScrapedContent:
         if "error" in item:
             error_msg = item.get("errorDescription") or item["error"]
             # "Restricted access" means partial data — log warning but continue with what we have
             if "restricted" in error_msg.lower() or "partial" in error_msg.lower():
-                import logging
-                logging.getLogger(__name__).warning(f"Apify partial data warning: {error_msg}")
+                logger.warning(f"Apify partial data warning: {error_msg}")
             else:
                 raise Exception(f"Apify error: {error_msg}")
 
@@ -72,10 +226,9 @@ class ApifyClient:
                 images = [x for x in [item.get("displayUrl"), item.get("thumbnailUrl")] if x]
             caption = item.get("caption", "")
             author = item.get("ownerUsername") or item.get("owner", {}).get("username", "")
-            import logging
             # downloadedVideo = pre-downloaded MP4 on Apify servers (no CDN blocks, no region restrictions)
             video_url = item.get("downloadedVideo") or item.get("videoUrl") or item.get("displayUrl")
-            logging.getLogger(__name__).info(f"Instagram scraped — author: {author}, caption length: {len(caption)}, images: {len(images)}, has_downloaded_video: {bool(item.get('downloadedVideo'))}")
+            logger.info(f"Instagram scraped — author: {author}, caption length: {len(caption)}, images: {len(images)}, has_downloaded_video: {bool(item.get('downloadedVideo'))}")
             
             content = ScrapedContent(
                 video_url=video_url,
@@ -99,11 +252,10 @@ class ApifyClient:
         else:
             raise ValueError(f"Unknown platform: {platform}")
             
-        # PRINT TO TERMINAL (User Request)
-        print(f"\n=== {platform.upper()} SCRAPED DATA ===")
-        print(content.model_dump_json(indent=2))
-        print("===============================\n")
-        
+        # Full dump only at DEBUG: serializing every post isn't free at volume
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{platform} scraped data:\n{content.model_dump_json(indent=2)}")
+
         return content
 
 
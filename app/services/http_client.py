@@ -0,0 +1,51 @@
+import logging
+import httpx
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Browser-like UA for CDN media fetches (some CDNs reject default client UAs)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# One long-lived client per upstream family. httpx keeps a keep-alive pool per
+# origin inside each client, so repeated calls to api.apify.com or the same CDN
+# reuse TCP/TLS connections instead of handshaking on every job.
+PROFILES = {
+    "apify": {"timeout": httpx.Timeout(120.0, connect=10.0)},
+    "media": {"timeout": httpx.Timeout(60.0, connect=10.0), "follow_redirects": True},
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    if not settings.http2_enabled:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is missing; using HTTP/1.1")
+        return False
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Shared client for an upstream profile ("apify", "media"), created on first use"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        )
+        client = httpx.AsyncClient(limits=limits, http2=_http2_available(), **PROFILES[name])
+        _clients[name] = client
+    return client
+
+
+async def close_http_clients():
+    """Close every shared client (call once on process shutdown)"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,183 @@
+"""CPU-bound media helpers (frame sampling, scoring, image preparation, JPEG encoding).
+
+Everything here is a plain module-level function on plain arguments so it can
+run inside the media process pool (see app.services.media_pool). Keep this
+module free of app settings, DB and network imports: pool workers import it
+on startup.
+"""
+import cv2
+import numpy as np
+
+# Streaming reads of http(s) URLs
+STREAM_TIMEOUT_MS = 30000
+
+# Frame sampling
+MAX_FRAME_SIDE = 512  # Longest side of frames sent to the model
+SEEK_GAP_SECONDS = 2.0  # Seek instead of grab() when the next sample is at least this far ahead
+FALLBACK_INTERVAL = 30  # Frame stride when the container has no duration metadata
+FRAME_CANDIDATES = 32  # Frames sampled from the video before scoring
+FRAME_BUDGET = 12  # Max frames sent to the model after scoring/dedup
+DUPLICATE_HASH_DISTANCE = 6  # dHash bits (of 64) at or below which two frames may be the same shot...
+DUPLICATE_HIST_DISTANCE = 0.25  # ...if their colour histograms (L1, 0-2) are also this close
+DARK_FRAME_LEVEL = 16  # Mean grey level below which a frame is treated as blank
+JPEG_QUALITY = 85  # Frames and re-encoded images; OpenCV's default (95) roughly doubles the bytes for no visible gain at 512px
+
+# Post images (carousel fallback)
+IMAGE_MIME_TYPES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def extract_frames(video_path: str, max_frames: int = FRAME_BUDGET) -> list[bytes]:
+    """Pick up to `max_frames` informative, non-duplicate frames as JPEG bytes"""
+    candidates = sample_frames(video_path, max(FRAME_CANDIDATES, max_frames))
+    return [encode_jpeg(candidates[i]) for i in select_frames(candidates, max_frames)]
+
+
+def sample_frames(video_path: str, max_frames: int) -> list[np.ndarray]:
+    """Sample up to `max_frames` evenly spaced frames, downscaled to MAX_FRAME_SIDE.
+
+    Targets are picked by timestamp from the video duration. Short gaps are
+    skipped with grab() (no colour conversion or copy), long gaps with a
+    seek, so only the sampled frames are ever fully retrieved.
+    """
+    video = _open_video(video_path)
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS)
+        total = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        if fps <= 0 or total <= 0:
+            return _extract_frames_sequential(video, max_frames)
+
+        duration = total / fps
+        # Middle of each of `max_frames` equal segments (skips the usual black first frame)
+        targets = sorted({min(total - 1, int(duration * (i + 0.5) / max_frames * fps)) for i in range(max_frames)})
+        seek_gap = max(1, int(fps * SEEK_GAP_SECONDS))
+
+        frames, pos = [], 0
+        for target in targets:
+            gap = target - pos
+            if gap >= seek_gap:
+                video.set(cv2.CAP_PROP_POS_FRAMES, target)
+                pos = target
+            else:
+                while pos < target and video.grab():
+                    pos += 1
+                if pos < target:
+                    break
+            ok, frame = video.read()
+            if not ok:
+                break
+            pos += 1
+            frames.append(downscale(frame))
+        return frames
+    finally:
+        video.release()
+
+
+def _open_video(source: str) -> cv2.VideoCapture:
+    if source.startswith(("http://", "https://")):
+        timeouts = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, STREAM_TIMEOUT_MS, cv2.CAP_PROP_READ_TIMEOUT_MSEC, STREAM_TIMEOUT_MS]
+        return cv2.VideoCapture(source, cv2.CAP_FFMPEG, timeouts)
+    return cv2.VideoCapture(source)
+
+
+def _extract_frames_sequential(video: cv2.VideoCapture, max_frames: int) -> list[np.ndarray]:
+    """Fallback for videos without frame count/fps metadata: one frame every FALLBACK_INTERVAL"""
+    frames, count = [], 0
+    while video.isOpened() and len(frames) < max_frames:
+        if count % FALLBACK_INTERVAL == 0:
+            ok, frame = video.read()
+            if not ok:
+                break
+            frames.append(downscale(frame))
+        elif not video.grab():
+            break
+        count += 1
+    return frames
+
+
+def select_frames(frames: list[np.ndarray], budget: int) -> list[int]:
+    """Indices (in time order) of the most informative frames, near-duplicates removed.
+
+    Frames are scored by colour-histogram change against their neighbours
+    (scene cuts, new ingredients entering the shot) and taken greedily by
+    score, skipping any frame whose difference hash and colour histogram
+    both match one already chosen (same layout and same colours).
+    """
+    n = len(frames)
+    if n <= 1:
+        return list(range(n))
+
+    # 9x8 greyscale thumbnails -> 64-bit difference hashes, shape (n, 64)
+    thumbs = np.stack([cv2.resize(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA) for f in frames]).astype(np.int16)
+    hashes = (thumbs[:, :, 1:] > thumbs[:, :, :-1]).reshape(n, -1)
+    hash_distances = (hashes[:, None, :] != hashes[None, :, :]).sum(axis=2)
+
+    # 64-bin colour histograms (4 levels per BGR channel) from 32x32 thumbnails
+    small = np.stack([cv2.resize(f, (32, 32), interpolation=cv2.INTER_AREA) for f in frames]).reshape(n, -1, 3) // 64
+    bins = small[..., 0].astype(np.int64) * 16 + small[..., 1] * 4 + small[..., 2] + np.arange(n)[:, None] * 64
+    hists = np.bincount(bins.ravel(), minlength=n * 64).reshape(n, 64) / bins.shape[1]
+    hist_distances = np.abs(hists[:, None, :] - hists[None, :, :]).sum(axis=2)
+    duplicates = (hash_distances <= DUPLICATE_HASH_DISTANCE) & (hist_distances <= DUPLICATE_HIST_DISTANCE)
+
+    # Change vs previous/next frame; the first frame always counts as a new scene
+    change = np.abs(np.diff(hists, axis=0)).sum(axis=1)
+    scores = np.maximum(np.concatenate([[2.0], change]), np.concatenate([change, [0.0]]))
+    scores[thumbs.mean(axis=(1, 2)) < DARK_FRAME_LEVEL] = -1.0  # blank / fade-to-black frames go last
+
+    selected: list[int] = []
+    for i in np.argsort(-scores, kind="stable"):
+        if len(selected) >= budget:
+            break
+        if duplicates[i, selected].any():
+            continue
+        selected.append(int(i))
+    return sorted(selected)
+
+
+def downscale(frame: np.ndarray) -> np.ndarray:
+    h, w = frame.shape[:2]
+    if max(w, h) > MAX_FRAME_SIDE:
+        scale = MAX_FRAME_SIDE / max(w, h)
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def encode_jpeg(frame: np.ndarray) -> bytes:
+    _, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buf.tobytes()
+
+
+def image_mime_type(data: bytes) -> str | None:
+    """MIME type from the file signature, for the formats the vision API accepts"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime in IMAGE_MIME_TYPES:
+        if data.startswith(signature):
+            return mime
+    return None
+
+
+def prepare_images(images: list[bytes]) -> list[tuple[str, bytes]]:
+    """(MIME type, bytes) of each image, downscaled to MAX_FRAME_SIDE.
+
+    Larger images are re-encoded as JPEG; a JPEG that already fits is passed
+    through untouched. Images OpenCV can't decode are kept as-is if the API
+    accepts their format (e.g. GIF), otherwise dropped.
+    """
+    prepared = []
+    for data in images:
+        mime = image_mime_type(data)
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            if mime is not None:
+                prepared.append((mime, data))
+            continue
+        if mime == "image/jpeg" and max(image.shape[:2]) <= MAX_FRAME_SIDE:
+            prepared.append((mime, data))
+        else:
+            prepared.append(("image/jpeg", encode_jpeg(downscale(image))))
+    return prepared
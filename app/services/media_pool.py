@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.config import get_settings
+from app.services import media_worker
+from app.services.http_client import USER_AGENT
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Pool workers inherit the environment: FFmpeg uses this UA when streaming video URLs
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", f"user_agent;{USER_AGENT}")
+
+KILL_SIGNAL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+
+class _Pool:
+    """One executor plus what's needed to kill a single hung task in it"""
+
+    def __init__(self, size: int):
+        # spawn: required for max_tasks_per_child, and safe with the worker's threads.
+        # Each child re-imports the parent's __main__ (see the guard in app.worker),
+        # so keep its entry point (media_worker) and the media functions light.
+        context = multiprocessing.get_context("spawn")
+        self.reports = context.Queue()
+        options = {}
+        if sys.version_info >= (3, 11) and settings.media_pool_max_tasks_per_child:
+            options["max_tasks_per_child"] = settings.media_pool_max_tasks_per_child
+        self.executor = ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=context,
+            initializer=media_worker.init,
+            initargs=(self.reports,),
+            **options,
+        )
+        self.futures: dict[int, Future] = {}
+        self.timed_out: set[int] = set()
+        self.pids: dict[int, int] = {}
+
+    def submit(self, token: int, fn, *args) -> Future:
+        future = self.executor.submit(media_worker.call, token, fn, *args)
+        self.futures[token] = future
+        future.add_done_callback(lambda _: self.futures.pop(token, None))
+        return future
+
+    def busy(self) -> list[Future]:
+        """In-flight tasks that may still finish on their own"""
+        return [f for token, f in list(self.futures.items()) if token not in self.timed_out]
+
+    def collect(self):
+        """Read the children's (token, pid) reports, keeping only tasks still running"""
+        while True:
+            try:
+                token, pid = self.reports.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                break
+            self.pids[token] = pid
+        for token in [t for t in self.pids if t not in self.futures]:
+            del self.pids[token]
+
+    def kill_timed_out(self):
+        self.collect()
+        for token in self.timed_out:
+            pid = self.pids.get(token)
+            if pid is None:
+                continue  # never started: shutdown(cancel_futures=True) drops it
+            try:
+                os.kill(pid, KILL_SIGNAL)
+            except OSError:
+                pass
+
+    def close(self, wait: bool = False):
+        self.kill_timed_out()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        self.reports.close()
+
+
+class MediaPool:
+    """Dedicated process pool for CPU-bound media work (decode, resize, JPEG encode).
+
+    Keeps decoding off the event loop and out of the GIL, bounded to
+    `media_pool_workers` processes. Workers are recycled after
+    `media_pool_max_tasks_per_child` tasks (Python 3.11+) to cap leaks in
+    native code. A task that exceeds `media_task_timeout_seconds` fails on its
+    own: new tasks go to a fresh pool, and the old one is closed (killing the
+    wedged decoder) once its other in-flight tasks have finished.
+    """
+
+    def __init__(self):
+        self._pool: _Pool | None = None
+        self._retiring: dict[_Pool, asyncio.Task] = {}
+        self._tokens = itertools.count()
+
+    @property
+    def size(self) -> int:
+        return settings.media_pool_workers or os.cpu_count() or 1
+
+    def _get_pool(self) -> _Pool:
+        if self._pool is None:
+            self._pool = _Pool(self.size)
+            logger.info(f"Media pool started with {self.size} process(es)")
+        return self._pool
+
+    async def run(self, fn, *args, timeout: float = None):
+        """Run `fn(*args)` in the pool. `fn` must be a picklable module-level function."""
+        timeout = settings.media_task_timeout_seconds if timeout is None else timeout
+        pool = self._get_pool()
+        token = next(self._tokens)
+        try:
+            future = pool.submit(token, fn, *args)
+        except BrokenProcessPool:
+            # A process died while the pool was idle: this task never ran, give it a fresh pool
+            logger.warning("Media pool broken while idle, restarting")
+            self._discard(pool)
+            pool = self._get_pool()
+            future = pool.submit(token, fn, *args)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            pool.collect()
+            return result
+        except asyncio.TimeoutError:
+            logger.error(f"Media task {fn.__name__} timed out after {timeout}s, retiring its pool")
+            pool.timed_out.add(token)
+            self._retire(pool)
+            raise TimeoutError(f"Media task {fn.__name__} timed out after {timeout}s")
+        except BrokenProcessPool:
+            # A worker died (OOM kill, segfault in a decoder): start fresh for the next task
+            self._discard(pool)
+            raise
+
+    def _discard(self, pool: _Pool):
+        if self._pool is pool:
+            self._pool = None
+        pool.close()
+
+    def _retire(self, pool: _Pool):
+        """Stop giving `pool` work and close it once only its hung tasks are left"""
+        if self._pool is not pool:
+            return  # already retiring: its drain loop picks up the new timeout
+        self._pool = None
+        task = asyncio.create_task(self._drain(pool))
+        self._retiring[pool] = task
+        task.add_done_callback(lambda _: self._retiring.pop(pool, None))
+
+    async def _drain(self, pool: _Pool):
+        while busy := pool.busy():
+            # Re-checked every second so tasks that time out meanwhile stop counting
+            await asyncio.wait([asyncio.wrap_future(f) for f in busy], timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+        pool.close()
+        logger.info(f"Retired media pool closed ({len(pool.timed_out)} hung task(s) killed)")
+
+    def shutdown(self):
+        for pool, task in list(self._retiring.items()):
+            task.cancel()
+            pool.close()
+        self._retiring.clear()
+        if self._pool is not None:
+            self._pool.close(wait=True)
+            self._pool = None
+
+
+media_pool = MediaPool()
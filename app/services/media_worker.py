@@ -0,0 +1,23 @@
+"""Entry point of media pool processes (see app.services.media_pool).
+
+Spawned children import this module first, so it must stay free of app
+imports: anything imported here is paid again on every pool (re)start.
+"""
+import os
+
+# Where this child reports which task it is running: (token, pid)
+_reports = None
+
+
+def init(reports):
+    global _reports
+    _reports = reports
+    # Reports only matter while the task runs: never hold up this child's exit flushing them
+    reports.cancel_join_thread()
+
+
+def call(token: int, fn, *args):
+    """Run `fn(*args)`, first telling the parent which process runs `token`
+    so a task that hangs can be killed on its own"""
+    _reports.put((token, os.getpid()))
+    return fn(*args)
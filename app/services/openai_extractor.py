@@ -1,11 +1,18 @@
-import cv2
 import base64
+import hashlib
 import json
-import logging
 import asyncio
+import logging
+import time
+import openai
 from openai import AsyncOpenAI
+from app.cache import TieredCache, content_key
 from app.config import get_settings
+from app.metrics import FRAME_EXTRACTION_SECONDS, OPENAI_REQUEST_SECONDS, OPENAI_TOKENS_TOTAL, timed
 from app.schemas import RecipeData, Ingredient
+from app.services import media
+from app.services.media_pool import media_pool
+from app.services.rate_limit import openai_requests, openai_tokens, openai_concurrency, retry_after_seconds
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -34,69 +41,153 @@ Rules:
 """
 
 
+TEXT_PROMPT = """
+Creator: {author}
+Caption: "{caption}"
+
+Return this JSON:
+{{
+    "title": "Recipe Title",
+    "prep_time_minutes": 10,
+    "cook_time_minutes": 20,
+    "ingredients": [{{"item": "name", "quantity": "1", "unit": "cup"}}],
+    "steps": ["Step 1", "Step 2"],
+    "tags": ["tag1"]
+}}
+
+Rules:
+- Use only what the caption states. Do not guess ingredients, amounts or steps that are not written.
+- Leave "quantity" and "unit" empty when the caption gives no amount.
+- If the caption has no recipe, return empty "ingredients" and "steps".
+"""
+
+
+MAX_TOKENS = 2000
+
+
+# Bump when the prompts or parsing change so old cached results stop matching
+PROMPT_VERSION = 1
+
+
 class OpenAIRecipeExtractor:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key, timeout=120.0)
+        # Retries are ours (_create) so 429s feed the shared rate limiter
+        self.client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url or None,
+            timeout=120.0,
+            max_retries=0,
+        )
         self.model = "gpt-4o-mini"
+        self.cache = TieredCache("extraction", ttl_seconds=settings.extraction_cache_ttl_seconds)
 
-    async def extract_from_video(self, video_path: str, caption: str, author: str = "") -> RecipeData:
-        frames = await asyncio.get_event_loop().run_in_executor(None, self._extract_frames, video_path)
+    async def extract_frames(self, source: str) -> list[bytes]:
+        """Sample frames (JPEG bytes) from a local video file or an http(s) video URL"""
+        with timed(FRAME_EXTRACTION_SECONDS, "stream" if source.startswith(("http://", "https://")) else "file"):
+            return await media_pool.run(media.extract_frames, source, media.FRAME_BUDGET)
+
+    async def extract_from_caption(self, caption: str, author: str = "") -> RecipeData:
+        """Text-only extraction: no media, only what the caption spells out"""
+        return await self._ask(TEXT_PROMPT.format(caption=caption, author=author), [])
+
+    async def extract_from_frames(self, frames: list[bytes], caption: str, author: str = "") -> RecipeData:
         if not frames:
             raise Exception("No frames extracted from video")
-        images = [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{f}"}} for f in frames]
-        return await self._ask(caption, author, images)
+        images = [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(f).decode()}"}} for f in frames]
+        return await self._ask(RECIPE_PROMPT.format(caption=caption, author=author), images)
 
     async def extract_from_images(self, image_data: list[str], caption: str, author: str = "") -> RecipeData:
         images = [{"type": "image_url", "image_url": {"url": url}} for url in image_data[:5]]
-        return await self._ask(caption, author, images)
+        return await self._ask(RECIPE_PROMPT.format(caption=caption, author=author), images)
 
-    async def _ask(self, caption: str, author: str, images: list) -> RecipeData:
+    async def _ask(self, prompt: str, images: list) -> RecipeData:
         messages = [
             {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": [{"type": "text", "text": RECIPE_PROMPT.format(caption=caption, author=author)}, *images]},
+            {"role": "user", "content": [{"type": "text", "text": prompt}, *images]},
         ]
+
+        # Same prompt + same image bytes + same model -> same answer (retries, reposts)
+        cache_key = self._cache_key(messages)
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Extraction cache hit ({cache_key[:12]})")
+            return RecipeData(**cached)
         
-        # Debug logging
         logger.info(f"Sending request to OpenAI model={self.model}")
-        
-        # PRINT TO TERMINAL (User Request)
-        print("\n=== OPENAI PROMPT ===")
-        print(f"--- System Prompt ---\n{SYSTEM_PROMPT}\n")
-        print(f"--- User Prompt ---\n{RECIPE_PROMPT.format(caption=caption, author=author)}")
-        print(f"[Plus {len(images)} images]")
-        print("=====================\n")
-        
-        resp = await self.client.chat.completions.create(model=self.model, messages=messages, response_format={"type": "json_object"}, max_tokens=2000)
-        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"OpenAI prompt:\n--- System Prompt ---\n{SYSTEM_PROMPT}\n--- User Prompt ---\n{prompt}\n[Plus {len(images)} images]")
+
+        resp = await self._create(messages)
         content = resp.choices[0].message.content
-        
-        # PRINT TO TERMINAL (User Request)
-        print("\n=== OPENAI RESPONSE ===")
-        print(content)
-        print("=======================\n")
-        
-        return self._parse(content)
-
-    def _extract_frames(self, video_path: str, max_frames: int = 20) -> list[str]:
-        video = cv2.VideoCapture(video_path)
-        total = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        interval = max(1, total // max_frames) if total > 0 else 30
-        frames, count = [], 0
-        while video.isOpened() and len(frames) < max_frames:
-            ok, frame = video.read()
-            if not ok:
-                break
-            if count % interval == 0:
-                h, w = frame.shape[:2]
-                if max(w, h) > 512:
-                    scale = 512 / max(w, h)
-                    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
-                
-                _, buf = cv2.imencode(".jpg", frame)
-                frames.append(base64.b64encode(buf).decode())
-            count += 1
-        video.release()
-        return frames
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"OpenAI response:\n{content}")
+
+        recipe = self._parse(content)
+        await self.cache.set(cache_key, recipe.model_dump())
+        return recipe
+
+    async def _create(self, messages: list):
+        """Chat completion within the shared request/token budgets, backing off on 429"""
+        cost = self._estimate_tokens(messages)
+        attempts = settings.retry_attempts + 1
+        for attempt in range(1, attempts + 1):
+            async with openai_concurrency.slot():
+                await openai_requests.acquire()
+                await openai_tokens.acquire(cost)
+                started = time.monotonic()
+                try:
+                    resp = await self.client.chat.completions.create(model=self.model, messages=messages, response_format={"type": "json_object"}, max_tokens=MAX_TOKENS)
+                    OPENAI_REQUEST_SECONDS.labels(self.model, "ok").observe(time.monotonic() - started)
+                    if resp.usage is not None:
+                        OPENAI_TOKENS_TOTAL.labels(self.model, "prompt").inc(resp.usage.prompt_tokens)
+                        OPENAI_TOKENS_TOTAL.labels(self.model, "completion").inc(resp.usage.completion_tokens)
+                    await openai_concurrency.on_success()
+                    return resp
+                except openai.RateLimitError as e:
+                    OPENAI_REQUEST_SECONDS.labels(self.model, "rate_limited").observe(time.monotonic() - started)
+                    if e.code == "insufficient_quota" or attempt == attempts:
+                        raise
+                    # Make every worker wait, not just this call
+                    pause = retry_after_seconds(e.response.headers) or settings.retry_delay_seconds * attempt
+                    openai_concurrency.on_throttle()
+                    # The paused bucket does the waiting on the next acquire; if it's
+                    # disabled or its store is down, wait here instead
+                    delay = 0 if await openai_requests.pause(pause) else pause
+                    logger.warning(f"OpenAI rate limited, retrying in {pause:.1f}s (attempt {attempt}/{attempts})")
+                except (openai.APIConnectionError, openai.InternalServerError) as e:
+                    OPENAI_REQUEST_SECONDS.labels(self.model, "error").observe(time.monotonic() - started)
+                    if attempt == attempts:
+                        raise
+                    delay = settings.retry_delay_seconds * attempt
+                    logger.warning(f"OpenAI request failed ({e}), retrying in {delay}s")
+                except Exception:
+                    OPENAI_REQUEST_SECONDS.labels(self.model, "error").observe(time.monotonic() - started)
+                    raise
+            # Back off outside the slot so other calls can use it meanwhile
+            await asyncio.sleep(delay)
+
+    def _estimate_tokens(self, messages: list) -> int:
+        """Rough rate-limit cost: ~4 characters per token, a flat cost per image, plus max_tokens"""
+        chars, images = 0, 0
+        for message in messages:
+            parts = message["content"] if isinstance(message["content"], list) else [{"type": "text", "text": message["content"]}]
+            for part in parts:
+                if part["type"] == "text":
+                    chars += len(part["text"])
+                else:
+                    images += 1
+        return chars // 4 + images * settings.openai_image_token_estimate + MAX_TOKENS
+
+    def _cache_key(self, messages: list) -> str:
+        texts, image_digests = [], []
+        for message in messages:
+            parts = message["content"] if isinstance(message["content"], list) else [{"type": "text", "text": message["content"]}]
+            for part in parts:
+                if part["type"] == "text":
+                    texts.append(part["text"])
+                else:
+                    image_digests.append(hashlib.sha256(part["image_url"]["url"].encode()).hexdigest())
+        return content_key(PROMPT_VERSION, self.model, texts, image_digests)
 
     def _parse(self, content: str) -> RecipeData:
         data = json.loads(content)
@@ -104,7 +195,8 @@ class OpenAIRecipeExtractor:
             title=data.get("title", "Untitled Recipe"),
             prep_time_minutes=data.get("prep_time_minutes"),
             cook_time_minutes=data.get("cook_time_minutes"),
-            ingredients=[Ingredient(**i) for i in data.get("ingredients", [])],
+            # Amounts the model couldn't find may come back as null
+            ingredients=[Ingredient(**{**i, "quantity": i.get("quantity") or "", "unit": i.get("unit") or ""}) for i in data.get("ingredients", [])],
             steps=data.get("steps", []),
             tags=data.get("tags", []),
         )
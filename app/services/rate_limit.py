@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal, RateLimitBucket, RateLimitLease
+from app.metrics import DB_COMMIT_SECONDS, timed
+from app.redis_client import USE_REDIS, redis_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+BUCKET_KEY = "eylo:ratelimit:bucket:{}"
+LEASES_KEY = "eylo:ratelimit:leases:{}"
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Delay a 429/503 response asks for (retry-after-ms, Retry-After seconds or HTTP date)"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket shared by every process: `per_minute` tokens refill per
+    minute, bursting up to `capacity` (default: one minute's worth).
+
+    Reservation style: `acquire` takes the tokens immediately, letting the
+    balance go negative, then sleeps until the refill has paid the debt back.
+    Waiters are therefore served in arrival order without polling. State lives
+    in Redis when configured, otherwise in the `rate_limit_buckets` table.
+    """
+
+    def __init__(self, name: str, per_minute: float, capacity: float = None):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+
+    async def acquire(self, amount: float = 1.0):
+        if self.rate <= 0:
+            return
+        balance = await self._apply(min(amount, self.capacity))
+        if balance is not None and balance < 0:
+            await asyncio.sleep(-balance / self.rate)
+
+    async def pause(self, seconds: float) -> bool:
+        """Provider said back off (Retry-After): make every process wait ~`seconds`.
+
+        Returns False if the bucket couldn't take the pause (limit disabled or
+        store unavailable); the caller then has to wait by itself.
+        """
+        if self.rate <= 0 or seconds <= 0:
+            return False
+        return await self._apply(0.0, ceiling=-seconds * self.rate) is not None
+
+    async def _apply(self, amount: float, ceiling: float = None) -> Optional[float]:
+        """Refill, clamp to `ceiling`, subtract `amount`; returns the new balance, or None if the store failed"""
+        ceiling = self.capacity if ceiling is None else min(ceiling, self.capacity)
+        try:
+            if USE_REDIS and redis_client:
+                return await self._apply_redis(amount, ceiling)
+            return await self._apply_db(amount, ceiling)
+        except Exception as e:
+            # Never fail a job because the limiter's store hiccuped
+            logger.warning(f"Rate limiter {self.name} unavailable, not limiting: {e}")
+            return None
+
+    async def _apply_redis(self, amount: float, ceiling: float) -> float:
+        from redis.exceptions import WatchError
+
+        key = BUCKET_KEY.format(self.name)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    tokens, updated_at = await pipe.hmget(key, "tokens", "updated_at")
+                    now = time.time()
+                    if tokens is None:
+                        tokens = self.capacity
+                    else:
+                        tokens = min(self.capacity, float(tokens) + max(0.0, now - float(updated_at)) * self.rate)
+                    balance = min(tokens, ceiling) - amount
+                    pipe.multi()
+                    pipe.hset(key, mapping={"tokens": balance, "updated_at": now})
+                    pipe.expire(key, 3600)
+                    await pipe.execute()
+                    return balance
+                except WatchError:
+                    continue  # another process updated the bucket first: recompute
+
+    async def _apply_db(self, amount: float, ceiling: float) -> float:
+        now = time.time()
+        refilled = RateLimitBucket.tokens + (literal(now) - RateLimitBucket.updated_at) * self.rate
+        refilled = case((refilled > self.capacity, self.capacity), else_=refilled)
+        clamped = case((refilled > ceiling, ceiling), else_=refilled)
+        stmt = (
+            update(RateLimitBucket)
+            .where(RateLimitBucket.name == self.name)
+            .values(tokens=clamped - amount, updated_at=now)
+            .returning(RateLimitBucket.tokens)
+        )
+        async with AsyncSessionLocal() as db:
+            # A single UPDATE ... RETURNING: the read-modify-write is atomic per row
+            balance = await db.scalar(stmt)
+            if balance is None:
+                dialect = db.get_bind().dialect.name
+                insert = (postgresql if dialect == "postgresql" else sqlite).insert(RateLimitBucket)
+                await db.execute(insert.values(name=self.name, tokens=self.capacity, updated_at=now).on_conflict_do_nothing())
+                balance = await db.scalar(stmt)
+            with timed(DB_COMMIT_SECONDS, "rate_limit"):
+                await db.commit()
+        return float(balance)
+
+
+class SharedSemaphore:
+    """At most `limit` holders across all processes (e.g. concurrently running
+    Apify actor runs). Holders are leases that expire after `lease_seconds`
+    (or what `hold` is given), so a crashed worker can't leak slots. Leases live in a Redis sorted set when
+    configured, otherwise in the `rate_limit_leases` table; if that store is
+    unavailable the limit falls back to per process.
+    """
+
+    def __init__(self, name: str, limit: int, lease_seconds: float):
+        self.name = name
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+        self._local = asyncio.Semaphore(limit) if limit > 0 else None
+
+    @asynccontextmanager
+    async def hold(self, lease_seconds: float = None):
+        if self.limit <= 0:
+            yield
+            return
+        lease = uuid.uuid4().hex
+        lease_seconds = self.lease_seconds if lease_seconds is None else lease_seconds
+        try:
+            if USE_REDIS and redis_client:
+                await self._acquire_redis(lease, lease_seconds)
+            else:
+                await self._acquire_db(lease, lease_seconds)
+        except Exception as e:
+            logger.warning(f"Semaphore {self.name} unavailable, limiting per process: {e}")
+            async with self._local:
+                yield
+            return
+
+        try:
+            yield
+        finally:
+            try:
+                if USE_REDIS and redis_client:
+                    await redis_client.zrem(LEASES_KEY.format(self.name), lease)
+                else:
+                    async with AsyncSessionLocal() as db:
+                        await db.execute(delete(RateLimitLease).where(RateLimitLease.name == self.name, RateLimitLease.lease == lease))
+                        await db.commit()
+            except Exception:
+                pass  # the lease expires on its own
+
+    async def _acquire_redis(self, lease: str, lease_seconds: float):
+        from redis.exceptions import WatchError
+
+        key = LEASES_KEY.format(self.name)
+        delay = 0.25
+        async with redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    now = time.time()
+                    await pipe.zremrangebyscore(key, "-inf", now)
+                    if await pipe.zcard(key) < self.limit:
+                        # Keep the key as long as its longest lease: a shorter hold must not cut it
+                        ttl = max(await pipe.ttl(key), int(lease_seconds) + 60)
+                        pipe.multi()
+                        pipe.zadd(key, {lease: now + lease_seconds})
+                        pipe.expire(key, ttl)
+                        await pipe.execute()
+                        return
+                    await pipe.unwatch()
+                except WatchError:
+                    continue
+                # Full: back off with jitter so waiters don't stampede
+                await asyncio.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, 5.0)
+
+    async def _acquire_db(self, lease: str, lease_seconds: float):
+        delay = 0.25
+        while not await self._try_db(lease, lease_seconds):
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, 5.0)
+
+    async def _try_db(self, lease: str, lease_seconds: float) -> bool:
+        """Take a lease if fewer than `limit` unexpired ones are held, in one transaction"""
+        now = time.time()
+        held = (
+            select(func.count())
+            .select_from(RateLimitLease)
+            .where(RateLimitLease.name == self.name, RateLimitLease.expires_at > now)
+            .scalar_subquery()
+        )
+        take = insert(RateLimitLease).from_select(
+            ["name", "lease", "expires_at"],
+            select(literal(self.name), literal(lease), literal(now + lease_seconds)).where(held < self.limit),
+        )
+        async with AsyncSessionLocal() as db:
+            try:
+                if db.get_bind().dialect.name == "postgresql":
+                    # Serialize count-then-insert per semaphore; SQLite already serializes writers
+                    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(LEASES_KEY.format(self.name)))))
+                await db.execute(delete(RateLimitLease).where(RateLimitLease.name == self.name, RateLimitLease.expires_at <= now))
+                taken = (await db.execute(take)).rowcount == 1
+                await db.commit()
+                return taken
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                # SQLite "database is locked": another process is taking a slot, try again
+                await db.rollback()
+                return False
+
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit for one provider, per process.
+
+    Each success adds 1/limit (so about +1 slot per "window" of healthy
+    calls); a rate-limit response halves the limit, at most once per
+    `cooldown` seconds so one burst of 429s doesn't collapse it to the floor.
+    """
+
+    def __init__(self, name: str, maximum: int, minimum: int = 1, initial: int = None, cooldown: float = 5.0):
+        self.name = name
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(initial or max(self.minimum, self.maximum // 2))
+        self.cooldown = cooldown
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._changed = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self._in_flight -= 1
+                self._changed.notify_all()
+
+    async def on_success(self):
+        if self.limit >= self.maximum:
+            return
+        async with self._changed:
+            previous = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            if int(self.limit) > previous:
+                # A new slot opened: wake waiters now rather than on the next release
+                self._changed.notify_all()
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        logger.warning(f"{self.name} rate limited: concurrency limit now {int(self.limit)}")
+
+
+# Provider limits, shared by every API/worker process
+openai_requests = TokenBucket("openai:requests", settings.openai_requests_per_minute)
+openai_tokens = TokenBucket("openai:tokens", settings.openai_tokens_per_minute)
+openai_concurrency = AdaptiveConcurrency("OpenAI", maximum=settings.openai_max_concurrency)
+# Leases outlive the run's wait deadline by this much (ApifyClient sizes each one per batch)
+APIFY_RUN_LEASE_MARGIN_SECONDS = 120
+apify_runs = SharedSemaphore("apify:runs", settings.apify_max_concurrent_runs, lease_seconds=settings.apify_max_wait_seconds + APIFY_RUN_LEASE_MARGIN_SECONDS)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import yt_dlp
 from app.schemas import ScrapedContent
@@ -10,8 +11,8 @@ class YouTubeClient:
         self.ydl_opts = {"quiet": True, "no_warnings": True, "format": "best[ext=mp4]/best"}
 
     async def scrape_url(self, url: str) -> ScrapedContent:
-        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        # yt-dlp is blocking network I/O: keep it off the event loop other jobs share
+        info = await asyncio.to_thread(self._extract_info, url)
         if not info:
             raise Exception(f"yt-dlp returned no info for {url}")
         
@@ -24,12 +25,14 @@ class YouTubeClient:
             duration=info.get("duration"),
         )
         
-        # Print for debugging as requested
-        print("\n=== YOUTUBE SCRAPED DATA ===")
-        print(content.model_dump_json(indent=2))
-        print("============================\n")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"YouTube scraped data:\n{content.model_dump_json(indent=2)}")
         
         return content
 
+    def _extract_info(self, url: str) -> dict:
+        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+            return ydl.extract_info(url, download=False)
+
 
 youtube_client = YouTubeClient()
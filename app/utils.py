@@ -1,5 +1,11 @@
 import re
 from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+# Post / video ids per platform. YouTube ids are always 11 chars.
+INSTAGRAM_ID = re.compile(r"instagram\.com/(?:[\w.]+/)?(p|reels?|tv)/([\w-]+)", re.IGNORECASE)
+TIKTOK_ID = re.compile(r"tiktok\.com/.*?/(?:video|photo)/(\d+)", re.IGNORECASE)
+YOUTUBE_PATH_ID = re.compile(r"(?:youtu\.be/|youtube\.com/(?:shorts|embed|live|v)/)([\w-]{11})", re.IGNORECASE)
 
 
 def is_supported_url(url: str) -> bool:
@@ -38,3 +44,52 @@ def get_post_type(url: str) -> str:
         return 'tiktok_video'
         
     return 'unknown'
+
+
+def get_media_id(url: str) -> Optional[str]:
+    """Platform post/video id (Instagram shortcode, TikTok or YouTube video id)"""
+    platform = get_platform(url)
+    if platform == 'instagram':
+        match = INSTAGRAM_ID.search(url)
+        return match.group(2) if match else None
+    if platform == 'tiktok':
+        match = TIKTOK_ID.search(url)
+        return match.group(1) if match else None
+    if platform == 'youtube':
+        match = YOUTUBE_PATH_ID.search(url)
+        if match:
+            return match.group(1)
+        video_id = parse_qs(urlsplit(url).query).get('v', [''])[0]
+        return video_id if re.fullmatch(r"[\w-]{11}", video_id) else None
+    return None
+
+
+def canonical_url(url: str) -> str:
+    """One URL per post: tracking params, `www`/`m.` and youtu.be variants collapse.
+
+    Instagram keeps its /reel/ vs /p/ path and YouTube its /shorts/ path since
+    get_post_type() reads them.
+    """
+    url = url.strip()
+    platform = get_platform(url)
+    media_id = get_media_id(url)
+    if platform == 'instagram' and media_id:
+        kind = INSTAGRAM_ID.search(url).group(1).lower()
+        return f"https://www.instagram.com/{'reel' if kind == 'reels' else kind}/{media_id}/"
+    if platform == 'youtube' and media_id:
+        if '/shorts/' in url.lower():
+            return f"https://www.youtube.com/shorts/{media_id}"
+        return f"https://www.youtube.com/watch?v={media_id}"
+    if platform in ('instagram', 'tiktok'):
+        return url.split("?")[0].split("#")[0]
+    return url
+
+
+def canonical_key(url: str) -> str:
+    """Dedup key: `<platform>:<media id>`, or the canonical URL when there is no id (e.g. vm.tiktok.com short links)"""
+    platform = get_platform(url)
+    media_id = get_media_id(url)
+    if media_id:
+        return f"{platform}:{media_id}"
+    parts = urlsplit(canonical_url(url))
+    return f"{platform}:{parts.netloc.lower().removeprefix('www.')}{parts.path.rstrip('/')}" + (f"?{parts.query}" if parts.query else "")
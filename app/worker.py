@@ -1,48 +1,130 @@
 import asyncio
 import logging
+import signal
 from app.config import get_settings
-from app.queue import dequeue_recipe_import
-from app.agent.recipe_agent import RecipeAgent
 
+# Media pool children are spawned, so each one re-imports this module as
+# __mp_main__: keep the Redis ping, DB engines and OpenAI client out of them
+if __name__ != "__mp_main__":
+    from prometheus_client import start_http_server
+    from app.queue import dequeue_recipe_imports, ack_recipe_import, run_queue_maintenance, release_worker
+    from app.agent.recipe_agent import RecipeAgent
+    from app.services.http_client import close_http_clients
+    from app.services.media_pool import media_pool
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+
+async def _process(agent: "RecipeAgent", job_data: dict):
+    """Run a single job inside its pool slot"""
+    try:
+        # Agent handles its own error update logic for the specific job
+        await agent.process_job(job_data)
+    except Exception as e:
+        logger.error(f"Job {job_data.get('job_id')} crashed: {str(e)}")
+    # Cancelled jobs (shutdown) are not acked, so they go back to the queue
+    await ack_recipe_import(job_data)
+
+
+async def _wait_or_stop(stop: asyncio.Event, seconds: float):
+    """Sleep for `seconds`, waking early if shutdown was requested"""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def _install_signal_handlers(stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: fall back to KeyboardInterrupt handling below
+            pass
+
+
+async def _drain(in_flight: set):
+    """Let in-flight jobs finish, cancelling whatever is left after the shutdown timeout"""
+    if not in_flight:
+        return
+    logger.info(f"Draining {len(in_flight)} in-flight job(s)...")
+    done, pending = await asyncio.wait(in_flight, timeout=settings.worker_shutdown_timeout_seconds)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"Cancelled {len(pending)} job(s) still running after {settings.worker_shutdown_timeout_seconds}s")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
 async def run():
-    """Main worker loop using Agent architecture"""
+    """Main worker loop using Agent architecture.
+
+    Keeps up to `worker_concurrency` jobs in flight; inside the agent they
+    queue per pipeline stage. Jobs are only claimed for free slots, so queued
+    work stays available to other workers.
+    """
     logger.info("🚀 Recipe Agent Worker started")
-    
+    if settings.worker_metrics_port:
+        start_http_server(settings.worker_metrics_port)
+        logger.info(f"Metrics on :{settings.worker_metrics_port}/metrics")
+
     # Initialize Agent
     agent = RecipeAgent()
-    
-    attempts = settings.retry_attempts
-    delay = settings.retry_delay_seconds
-    
-    while True:
-        try:
-            # Get next job from queue (blocking)
-            job_data = dequeue_recipe_import()
-            
-            if job_data:
-                # Delegate processing to the Agent
-                # Agent handles its own error update logic for the specific job
-                await agent.process_job(job_data)
-            else:
-                # No job found, wait before checking again
-                await asyncio.sleep(2)
-            
-        except KeyboardInterrupt:
-            logger.info("Worker shutting down...")
-            break
-        except Exception as e:
-            logger.error(f"Worker loop error: {str(e)}")
-            await asyncio.sleep(5)
+
+    concurrency = max(1, settings.worker_concurrency)
+    if 1 < settings.apify_batch_max_size and concurrency < settings.apify_batch_max_size:
+        logger.warning(
+            f"WORKER_CONCURRENCY ({concurrency}) < APIFY_BATCH_MAX_SIZE ({settings.apify_batch_max_size}): "
+            f"Apify batches can't fill, so scrapes wait the full {settings.apify_batch_window_seconds}s window"
+        )
+    in_flight: set[asyncio.Task] = set()
+    stop = asyncio.Event()
+    _install_signal_handlers(stop)
+    logger.info(f"Worker concurrency: {concurrency}")
+    maintenance = asyncio.create_task(run_queue_maintenance())
+
+    try:
+        while not stop.is_set():
+            # Backpressure: wait for a free slot before taking another job
+            if len(in_flight) >= concurrency:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                # Claim as many jobs as we have free slots (waits for work when idle)
+                free_slots = concurrency - len(in_flight)
+                jobs = await dequeue_recipe_imports(limit=min(free_slots, settings.queue_batch_size))
+            except Exception as e:
+                logger.error(f"Worker loop error: {str(e)}")
+                await _wait_or_stop(stop, 5)
+                continue
+
+            for job_data in jobs:
+                task = asyncio.create_task(_process(agent, job_data))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+    except KeyboardInterrupt:
+        pass
+
+    logger.info("Worker shutting down...")
+    await _drain(in_flight)
+    await agent.close()
+    maintenance.cancel()
+    await release_worker()
+    await close_http_clients()
+    media_pool.shutdown()
+    logger.info("Worker stopped")
 
 if __name__ == "__main__":
-    asyncio.run(run())
\ No newline at end of file
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1 @@
+# Offline pipeline benchmarks (python -m benchmarks.run)
@@ -0,0 +1,228 @@
+"""Local stand-ins for Apify, OpenAI and the video CDN.
+
+Each is a small ASGI app configured from environment variables, started by
+benchmarks/run.py as its own uvicorn process so it doesn't share the
+worker's CPU or event loop:
+
+    python -m uvicorn benchmarks.fakes:apify_app --port 9001
+    python -m uvicorn benchmarks.fakes:openai_app --port 9002
+    python -m uvicorn benchmarks.fakes:media_app --port 9003
+
+BENCH_MANIFEST is a JSON file {post_id: {"caption", "video", "duration"}}
+written by the runner; the fake Apify serves posts from it and points their
+video URLs at BENCH_MEDIA_URL. Like the real Apify, it POSTs the run-finished
+payload to each ad-hoc webhook (the `webhooks` run option) when a run ends.
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+async def _latency(mean: float):
+    """Sleep ~`mean` seconds (uniform 0.5x-1.5x), like a real provider's spread"""
+    if mean > 0:
+        await asyncio.sleep(mean * (0.5 + random.random()))
+
+
+# --- Apify ------------------------------------------------------------------
+
+APIFY_RUN_SECONDS = _env_float("BENCH_APIFY_RUN_SECONDS", 5.0)  # Mean actor run duration
+APIFY_LATENCY_SECONDS = _env_float("BENCH_APIFY_LATENCY_SECONDS", 0.05)  # Mean API call latency
+APIFY_ERROR_RATE = _env_float("BENCH_APIFY_ERROR_RATE", 0.0)  # Share of posts returned as error items
+APIFY_RATE_LIMIT_RATE = _env_float("BENCH_APIFY_RATE_LIMIT_RATE", 0.0)  # Share of run starts answered with 429
+APIFY_WEBHOOK_LOSS_RATE = _env_float("BENCH_APIFY_WEBHOOK_LOSS_RATE", 0.0)  # Share of webhooks never delivered
+
+POST_ID = re.compile(r"/(?:video|reel|p)/([\w-]+)")
+
+apify_app = FastAPI(title="Fake Apify")
+_runs: dict[str, dict] = {}
+_manifest: dict = {}
+_webhook_tasks: set[asyncio.Task] = set()
+
+
+def _post(post_id: str) -> dict:
+    if not _manifest and os.environ.get("BENCH_MANIFEST"):
+        with open(os.environ["BENCH_MANIFEST"]) as f:
+            _manifest.update(json.load(f))
+    return _manifest.get(post_id) or {"caption": "", "video": None, "duration": None}
+
+
+def _item(url: str, platform: str) -> dict:
+    match = POST_ID.search(url)
+    post_id = match.group(1) if match else url
+    if random.random() < APIFY_ERROR_RATE:
+        return {"url": url, "error": "not_found", "errorDescription": "Post not found or private"}
+
+    post = _post(post_id)
+    video_url = f"{os.environ.get('BENCH_MEDIA_URL', '')}/{post['video']}" if post["video"] else None
+    if platform == "instagram":
+        return {
+            "inputUrl": url,
+            "shortCode": post_id,
+            "caption": post["caption"],
+            "ownerUsername": "bench",
+            "type": "Video",
+            "videoUrl": video_url,
+            "videoDuration": post["duration"],
+        }
+    return {
+        "submittedVideoUrl": url,
+        "id": post_id,
+        "text": post["caption"],
+        "authorMeta": {"name": "bench"},
+        "videoMeta": {"downloadAddr": video_url, "duration": post["duration"]},
+    }
+
+
+@apify_app.post("/acts/{actor_id}/runs")
+async def start_run(actor_id: str, request: Request):
+    await _latency(APIFY_LATENCY_SECONDS)
+    if random.random() < APIFY_RATE_LIMIT_RATE:
+        return JSONResponse({"error": {"type": "rate-limit-exceeded"}}, status_code=429, headers={"Retry-After": "1"})
+    run_input = await request.json()
+    urls = run_input.get("postURLs") or run_input.get("directUrls") or []
+    platform = "instagram" if "directUrls" in run_input else "tiktok"
+    run_id = uuid.uuid4().hex
+    _runs[run_id] = {
+        "finishes_at": time.monotonic() + APIFY_RUN_SECONDS * (0.5 + random.random()),
+        "items": [_item(url, platform) for url in urls],
+    }
+    webhooks = json.loads(base64.b64decode(request.query_params["webhooks"])) if "webhooks" in request.query_params else []
+    request_urls = [w["requestUrl"] for w in webhooks if "ACTOR.RUN.SUCCEEDED" in w.get("eventTypes", [])]
+    if request_urls:
+        task = asyncio.create_task(_fire_webhooks(run_id, request_urls))
+        _webhook_tasks.add(task)
+        task.add_done_callback(_webhook_tasks.discard)
+    return {"data": {"id": run_id, "status": "RUNNING"}}
+
+
+async def _fire_webhooks(run_id: str, request_urls: list[str]):
+    """POST the run-finished payload to each webhook once the run is done"""
+    await asyncio.sleep(max(0.0, _runs[run_id]["finishes_at"] - time.monotonic()))
+    payload = {
+        "eventType": "ACTOR.RUN.SUCCEEDED",
+        "eventData": {"actorRunId": run_id},
+        "resource": {"id": run_id, "status": "SUCCEEDED", "defaultDatasetId": run_id},
+    }
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        for url in request_urls:
+            if random.random() < APIFY_WEBHOOK_LOSS_RATE:
+                continue  # lost: the worker's safety-net polling has to notice the run ended
+            try:
+                (await client.post(url, json=payload)).raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"Webhook {url.split('?')[0]} for run {run_id} failed: {e}", flush=True)
+
+
+@apify_app.get("/actor-runs/{run_id}")
+async def get_run(run_id: str):
+    await _latency(APIFY_LATENCY_SECONDS)
+    run = _runs.get(run_id)
+    if run is None:
+        return JSONResponse({"error": {"type": "record-not-found"}}, status_code=404)
+    status = "SUCCEEDED" if time.monotonic() >= run["finishes_at"] else "RUNNING"
+    return {"data": {"id": run_id, "status": status, "defaultDatasetId": run_id}}
+
+
+@apify_app.get("/datasets/{dataset_id}/items")
+async def get_items(dataset_id: str):
+    await _latency(APIFY_LATENCY_SECONDS)
+    run = _runs.pop(dataset_id, None)
+    return run["items"] if run else []
+
+
+# --- OpenAI -----------------------------------------------------------------
+
+OPENAI_LATENCY_SECONDS = _env_float("BENCH_OPENAI_LATENCY_SECONDS", 2.0)  # Mean text-only completion time
+OPENAI_IMAGE_SECONDS = _env_float("BENCH_OPENAI_IMAGE_SECONDS", 0.3)  # Extra time per attached image
+OPENAI_RATE_LIMIT_RATE = _env_float("BENCH_OPENAI_RATE_LIMIT_RATE", 0.0)  # Share answered with 429
+OPENAI_ERROR_RATE = _env_float("BENCH_OPENAI_ERROR_RATE", 0.0)  # Share answered with 500
+
+FULL_RECIPE = {
+    "prep_time_minutes": 10,
+    "cook_time_minutes": 20,
+    "ingredients": [
+        {"item": "chicken thighs", "quantity": "500", "unit": "g"},
+        {"item": "garlic", "quantity": "3", "unit": "cloves"},
+        {"item": "soy sauce", "quantity": "2", "unit": "tbsp"},
+        {"item": "rice", "quantity": "1", "unit": "cup"},
+    ],
+    "steps": ["Marinate the chicken.", "Sear until golden.", "Serve over rice."],
+    "tags": ["dinner", "bench"],
+}
+
+openai_app = FastAPI(title="Fake OpenAI")
+
+
+@openai_app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    parts = [part for message in body["messages"] if isinstance(message["content"], list) for part in message["content"]]
+    images = sum(1 for part in parts if part.get("type") == "image_url")
+    prompt = " ".join(part["text"] for part in parts if part.get("type") == "text")
+
+    roll = random.random()
+    if roll < OPENAI_RATE_LIMIT_RATE:
+        await _latency(0.05)
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after-ms": "500"},
+        )
+    await _latency(OPENAI_LATENCY_SECONDS + images * OPENAI_IMAGE_SECONDS)
+    if roll < OPENAI_RATE_LIMIT_RATE + OPENAI_ERROR_RATE:
+        return JSONResponse({"error": {"message": "Internal error", "type": "server_error"}}, status_code=500)
+
+    # Captions that spell the recipe out pass the text tier; the rest only yield a title
+    match = re.search(r"Bench post (\d+)", prompt)
+    title = f"Bench recipe {match.group(1) if match else uuid.uuid4().hex[:8]}"
+    if images or "Ingredients:" in prompt:
+        recipe = {"title": title, **FULL_RECIPE}
+    else:
+        recipe = {"title": title, "ingredients": [], "steps": [], "tags": []}
+
+    completion_tokens = 180
+    prompt_tokens = len(prompt) // 4 + images * 255
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(recipe)},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+# --- Video CDN --------------------------------------------------------------
+
+MEDIA_LATENCY_SECONDS = _env_float("BENCH_MEDIA_LATENCY_SECONDS", 0.0)  # Mean time to first byte
+
+media_app = FastAPI(title="Fake CDN")
+
+
+@media_app.middleware("http")
+async def media_latency(request: Request, call_next):
+    await _latency(MEDIA_LATENCY_SECONDS)
+    return await call_next(request)
+
+
+# StaticFiles answers Range requests, which the streaming frame sampler relies on
+media_app.mount("/", StaticFiles(directory=os.environ.get("BENCH_MEDIA_DIR", "."), check_dir=False))
@@ -0,0 +1,390 @@
+"""Offline end-to-end benchmark of the worker pipeline.
+
+Runs the real worker (`python -m app.worker`, so the real RecipeAgent,
+queue, rate limiters and media pool) against local stand-ins for Apify,
+OpenAI and the video CDN (benchmarks/fakes.py), feeds it a batch of
+synthetic TikTok posts and reports:
+
+    - throughput (jobs/s) and end-to-end job latency p50/p99
+    - per-stage and per-call p50/p99, from the worker's Prometheus histograms
+    - peak RSS of the worker and its media pool processes
+
+Nothing leaves the machine, so every pipeline change can be measured for
+free. Example:
+
+    python -m benchmarks.run --jobs 200 --text-share 0.3 --json before.json
+
+Worker settings come from the environment as usual (PIPELINE_*_CONCURRENCY,
+WORKER_CONCURRENCY, VIDEO_STREAMING, REDIS_URL, ...). By default it uses a
+fresh SQLite database, the DB queue and no OpenAI rate limits.
+
+With --webhooks the real API (`uvicorn app.main:app`) also runs as the
+webhook receiver, the fake Apify POSTs run-finished events to it and the
+worker waits on those instead of polling. The API hands the event to the
+worker over Redis pub/sub, so this mode needs a real REDIS_URL:
+
+    REDIS_URL=redis://localhost:6379/0 python -m benchmarks.run --webhooks
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.videos import DEFAULT_SPECS, VideoSpec, generate
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Histograms from app/metrics.py in the report, with the label that names each series
+STAGE_HISTOGRAM = ("eylo_pipeline_stage_seconds", "stage")
+CALL_HISTOGRAMS = [
+    ("eylo_tool_seconds", "tool"),
+    ("eylo_apify_run_wait_seconds", "platform"),
+    ("eylo_media_download_seconds", "kind"),
+    ("eylo_frame_extraction_seconds", "source"),
+    ("eylo_openai_request_seconds", "outcome"),
+    ("eylo_db_commit_seconds", "operation"),
+]
+
+# A caption that spells the recipe out (accepted by the text tier) and one that doesn't (video tier)
+FULL_CAPTION = (
+    "Bench post {n}: weeknight garlic chicken.\n"
+    "Ingredients: 500 g chicken thighs, 3 cloves garlic, 2 tbsp soy sauce, 1 cup rice.\n"
+    "Steps: marinate the chicken, sear it until golden, serve over rice."
+)
+SHORT_CAPTION = "Bench post {n} - recipe in the video!"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def _rss_bytes(pid: int) -> int:
+    """Resident memory of `pid` and all its descendants (Linux /proc)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+
+def _quantile(q: float, values: list) -> float:
+    """Nearest-rank quantile of exact samples"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _histogram_quantile(q: float, buckets: list) -> float:
+    """Like PromQL histogram_quantile: linear interpolation inside the bucket
+    that holds the q-th observation. `buckets` is [(upper bound, cumulative count)]."""
+    total = buckets[-1][1]
+    rank = q * total
+    lower, below = 0.0, 0.0
+    for upper, count in buckets:
+        if count >= rank:
+            if math.isinf(upper):
+                return lower  # beyond the last finite bucket: its bound is all we know
+            return lower + (upper - lower) * (rank - below) / max(count - below, 1e-12)
+        lower, below = upper, count
+    return lower
+
+
+def _histograms(metrics_text: str, name: str, label: str) -> dict:
+    """{label value: (count, p50, p99)} for one histogram, merging its other labels"""
+    series: dict[str, dict[float, float]] = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != name:
+            continue
+        for sample in family.samples:
+            if not sample.name.endswith("_bucket"):
+                continue
+            buckets = series.setdefault(sample.labels.get(label, ""), {})
+            upper = float(sample.labels["le"])
+            buckets[upper] = buckets.get(upper, 0.0) + sample.value
+    result = {}
+    for key, buckets in series.items():
+        ordered = sorted(buckets.items())
+        if ordered and ordered[-1][1] > 0:
+            result[key] = (int(ordered[-1][1]), _histogram_quantile(0.5, ordered), _histogram_quantile(0.99, ordered))
+    return result
+
+
+def _posts(args, specs: list) -> tuple[dict, list]:
+    """(manifest for the fake Apify, submitted URLs)"""
+    rng = random.Random(args.seed)
+    # Unique ids per run, so Redis-backed scrape/extraction caches never hit across runs
+    prefix = str(int(time.time()))
+    manifest, urls = {}, []
+    for n in range(args.jobs):
+        post_id = f"{prefix}{n:06d}"
+        spec = specs[n % len(specs)]
+        caption = FULL_CAPTION if rng.random() < args.text_share else SHORT_CAPTION
+        manifest[post_id] = {"caption": caption.format(n=post_id), "video": spec.name, "duration": spec.seconds}
+        urls.append(f"https://www.tiktok.com/@bench/video/{post_id}")
+    return manifest, urls
+
+
+def _enqueue(urls: list) -> datetime:
+    """Insert the jobs the way POST /import/recipes does and wake the worker"""
+    from app.database import ImportJob, SessionLocal
+    from app.queue import enqueue_recipe_imports
+    from app.utils import canonical_key
+
+    user_id = str(uuid.uuid4())
+    jobs = [{"job_id": str(uuid.uuid4()), "user_id": user_id, "source_url": url} for url in urls]
+    started = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.add_all(
+            ImportJob(id=job["job_id"], user_id=user_id, source_url=job["source_url"], canonical_key=canonical_key(job["source_url"]), status="queued", stage="queued")
+            for job in jobs
+        )
+        db.commit()
+    finally:
+        db.close()
+    asyncio.run(enqueue_recipe_imports(jobs))
+    return started
+
+
+def _finished_jobs():
+    from app.database import ImportJob, SessionLocal
+
+    db = SessionLocal()
+    try:
+        return db.query(ImportJob.status, ImportJob.created_at, ImportJob.completed_at).filter(
+            ImportJob.status.in_(["completed", "failed"])
+        ).all()
+    finally:
+        db.close()
+
+
+def _naive(value: datetime) -> datetime:
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def run(args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="eylo-bench-"))
+    video_dir = Path(args.video_dir)
+    video_dir.mkdir(parents=True, exist_ok=True)
+    specs = [VideoSpec.parse(v) for v in args.videos.split(",")] if args.videos else DEFAULT_SPECS
+    for spec in specs:
+        print(f"Video {spec.name}...", flush=True)
+        generate(spec, video_dir)
+
+    manifest, urls = _posts(args, specs)
+    manifest_path = workdir / "manifest.json"
+    manifest_path.write_text(json.dumps(manifest))
+
+    ports = {name: _free_port() for name in ("apify", "openai", "media", "metrics", "api")}
+    env = dict(os.environ)
+    for name, value in {
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+        "REDIS_URL": "memory://",
+        "APIFY_API_TOKEN": "bench",
+        "OPENAI_API_KEY": "bench",
+        "JWT_SECRET": "bench",
+        "OPENAI_REQUESTS_PER_MINUTE": "0",
+        "OPENAI_TOKENS_PER_MINUTE": "0",
+        "APIFY_POLL_INITIAL_SECONDS": "0.5",
+        "APIFY_POLL_MAX_SECONDS": "2",
+    }.items():
+        env.setdefault(name, value)
+    if args.webhooks and env["REDIS_URL"].startswith("memory://"):
+        raise SystemExit("--webhooks needs REDIS_URL: the API passes run-finished events to the worker over Redis pub/sub")
+    env.update({
+        "APIFY_BASE_URL": f"http://127.0.0.1:{ports['apify']}",
+        "APIFY_WEBHOOK_URL": f"http://127.0.0.1:{ports['api']}/webhooks/apify" if args.webhooks else "",
+        "APIFY_WEBHOOK_SECRET": "bench" if args.webhooks else "",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+        "WORKER_METRICS_PORT": str(ports["metrics"]),
+        "BENCH_MANIFEST": str(manifest_path),
+        "BENCH_MEDIA_URL": f"http://127.0.0.1:{ports['media']}",
+        "BENCH_MEDIA_DIR": str(video_dir),
+        "BENCH_APIFY_RUN_SECONDS": str(args.apify_run_seconds),
+        "BENCH_APIFY_ERROR_RATE": str(args.apify_error_rate),
+        "BENCH_APIFY_RATE_LIMIT_RATE": str(args.apify_rate_limit_rate),
+        "BENCH_APIFY_WEBHOOK_LOSS_RATE": str(args.webhook_loss_rate),
+        "BENCH_OPENAI_LATENCY_SECONDS": str(args.openai_latency),
+        "BENCH_OPENAI_IMAGE_SECONDS": str(args.openai_image_seconds),
+        "BENCH_OPENAI_RATE_LIMIT_RATE": str(args.openai_rate_limit_rate),
+        "BENCH_OPENAI_ERROR_RATE": str(args.openai_error_rate),
+        "BENCH_MEDIA_LATENCY_SECONDS": str(args.media_latency),
+    })
+    # The runner imports app too (to enqueue and read results): same settings as the worker
+    os.environ.update(env)
+
+    processes = []
+    try:
+        for name in ("apify", "openai", "media"):
+            log = open(workdir / f"{name}.log", "w")
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", f"benchmarks.fakes:{name}_app", "--host", "127.0.0.1", "--port", str(ports[name]), "--log-level", "warning"],
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+            processes.append(process)
+            _wait_for_port(ports[name], process)
+
+        # Create the schema before the worker's first claim
+        from app.database import Base, engine
+        Base.metadata.create_all(bind=engine)
+
+        if args.webhooks:
+            api_log = open(workdir / "api.log", "w")
+            api = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(ports["api"]), "--log-level", "warning"],
+                cwd=ROOT, env=env, stdout=api_log, stderr=subprocess.STDOUT,
+            )
+            processes.append(api)
+            _wait_for_port(ports["api"], api, timeout=60.0)
+
+        worker_log = open(workdir / "worker.log", "w")
+        worker = subprocess.Popen([sys.executable, "-m", "app.worker"], cwd=ROOT, env=env, stdout=worker_log, stderr=subprocess.STDOUT)
+        processes.append(worker)
+        # Metrics server up = imports done and the worker loop starting: don't time startup
+        _wait_for_port(ports["metrics"], worker, timeout=60.0)
+
+        print(f"Enqueueing {args.jobs} jobs (logs in {workdir})", flush=True)
+        started = _enqueue(urls)
+        peak_rss = 0
+        deadline = time.monotonic() + args.timeout
+        last_report = 0.0
+        finished = []
+        while time.monotonic() < deadline:
+            if worker.poll() is not None:
+                raise RuntimeError(f"Worker exited with {worker.returncode}, see {workdir / 'worker.log'}")
+            peak_rss = max(peak_rss, _rss_bytes(worker.pid))
+            if time.monotonic() - last_report >= 1.0:
+                last_report = time.monotonic()
+                finished = _finished_jobs()
+                print(f"\r{len(finished)}/{args.jobs} finished", end="", flush=True)
+                if len(finished) >= args.jobs:
+                    break
+            time.sleep(0.25)
+        print()
+
+        metrics_text = httpx.get(f"http://127.0.0.1:{ports['metrics']}/metrics").text
+        api_metrics_text = httpx.get(f"http://127.0.0.1:{ports['api']}/metrics").text if args.webhooks else ""
+    finally:
+        for process in reversed(processes):
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    completed = [job for job in finished if job.status == "completed"]
+    failed = len(finished) - len(completed)
+    latencies = [(_naive(job.completed_at) - _naive(job.created_at)).total_seconds() for job in finished if job.completed_at]
+    elapsed = max((_naive(job.completed_at) - started).total_seconds() for job in finished if job.completed_at) if latencies else None
+
+    return {
+        "config": {
+            **vars(args),
+            **{k: v for k, v in env.items() if k.startswith(("PIPELINE_", "WORKER_", "MEDIA_POOL_", "VIDEO_", "APIFY_BATCH_", "QUEUE_"))},
+            "videos": [spec.name for spec in specs],
+        },
+        "jobs": args.jobs,
+        "completed": len(completed),
+        "failed": failed,
+        "unfinished": args.jobs - len(finished),
+        "elapsed_seconds": elapsed,
+        "jobs_per_second": len(finished) / elapsed if elapsed else None,
+        "latency_p50_seconds": _quantile(0.5, latencies) if latencies else None,
+        "latency_p99_seconds": _quantile(0.99, latencies) if latencies else None,
+        "peak_rss_bytes": peak_rss,
+        "webhooks_received": _histograms(api_metrics_text, "eylo_http_request_seconds", "route").get("/webhooks/apify", (0,))[0],
+        "stages": _histograms(metrics_text, *STAGE_HISTOGRAM),
+        "calls": {name: _histograms(metrics_text, name, label) for name, label in CALL_HISTOGRAMS},
+    }
+
+
+def _print_report(result: dict):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    print(f"Jobs: {result['completed']} completed, {result['failed']} failed, {result['unfinished']} unfinished")
+    if result["elapsed_seconds"]:
+        print(f"Throughput: {result['jobs_per_second']:.2f} jobs/s over {result['elapsed_seconds']:.1f}s")
+    print(f"Job latency: p50 {seconds(result['latency_p50_seconds'])}  p99 {seconds(result['latency_p99_seconds'])}")
+    print(f"Peak RSS (worker + media pool): {result['peak_rss_bytes'] / 2**20:.0f} MiB")
+    if result["config"]["webhooks"]:
+        print(f"Apify webhooks received by the API: {result['webhooks_received']}")
+
+    rows = [(f"stage {key}", *values) for key, values in result["stages"].items()]
+    for name, series in result["calls"].items():
+        rows += [(f"{name.removeprefix('eylo_').removesuffix('_seconds')} {key}", *values) for key, values in series.items()]
+    print(f"\n{'series':<44}{'count':>8}{'p50':>10}{'p99':>10}")
+    for label, count, p50, p99 in rows:
+        print(f"{label:<44}{count:>8}{seconds(p50):>10}{seconds(p99):>10}")
+    print("(stage/call percentiles are interpolated from histogram buckets)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--text-share", type=float, default=0.3, help="share of posts whose caption holds the full recipe")
+    parser.add_argument("--videos", default="", help="comma-separated SECONDSxWIDTHxHEIGHT specs, e.g. 15x360x640,60x1080x1920")
+    parser.add_argument("--video-dir", default=str(Path(tempfile.gettempdir()) / "eylo-bench-videos"), help="where generated videos are cached")
+    parser.add_argument("--apify-run-seconds", type=float, default=5.0)
+    parser.add_argument("--apify-error-rate", type=float, default=0.0)
+    parser.add_argument("--apify-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--webhooks", action="store_true", help="finish Apify runs by webhook through the real API (needs REDIS_URL)")
+    parser.add_argument("--webhook-loss-rate", type=float, default=0.0, help="share of webhooks the fake Apify drops (with --webhooks)")
+    parser.add_argument("--openai-latency", type=float, default=2.0)
+    parser.add_argument("--openai-image-seconds", type=float, default=0.3)
+    parser.add_argument("--openai-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--media-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=900.0, help="give up waiting for jobs after this many seconds")
+    parser.add_argument("--json", help="also write the results to this file, to compare runs")
+    args = parser.parse_args()
+
+    result = run(args)
+    _print_report(result)
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Synthetic MP4s for the fake CDN.
+
+Each video is a sequence of "shots" (a few seconds each) with a distinct
+colour scheme, a moving block and some noise, so the frame selector has real
+scene changes and near-duplicates to tell apart, like a cooking reel.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+FPS = 24
+SHOT_SECONDS = 3
+
+
+@dataclass(frozen=True)
+class VideoSpec:
+    seconds: int
+    width: int
+    height: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.seconds}s_{self.width}x{self.height}.mp4"
+
+    @classmethod
+    def parse(cls, value: str) -> "VideoSpec":
+        """"30x720x1280" -> 30 seconds, 720 wide, 1280 high"""
+        seconds, width, height = (int(v) for v in value.lower().split("x"))
+        return cls(seconds, width, height)
+
+
+DEFAULT_SPECS = [VideoSpec(15, 360, 640), VideoSpec(30, 720, 1280), VideoSpec(60, 1080, 1920)]
+
+
+def generate(spec: VideoSpec, directory: Path) -> Path:
+    """Write `spec` into `directory` (reused if it's already there)"""
+    path = directory / spec.name
+    if path.exists():
+        return path
+    tmp = path.with_suffix(".part.mp4")
+    writer = cv2.VideoWriter(str(tmp), cv2.VideoWriter_fourcc(*"mp4v"), FPS, (spec.width, spec.height))
+    rng = np.random.default_rng(spec.seconds * 7919 + spec.width)
+    block = max(16, spec.width // 6)
+    try:
+        for shot in range(-(-spec.seconds // SHOT_SECONDS)):
+            background = np.empty((spec.height, spec.width, 3), np.uint8)
+            background[:] = rng.integers(40, 220, 3, dtype=np.uint8)
+            # A gradient so shots differ in structure, not just in colour
+            background[:, :, shot % 3] = np.linspace(0, 255, spec.width, dtype=np.uint8)
+            colour = tuple(int(c) for c in rng.integers(0, 255, 3))
+            for i in range(min(SHOT_SECONDS, spec.seconds - shot * SHOT_SECONDS) * FPS):
+                frame = background.copy()
+                x = (i * 7 + shot * 53) % max(1, spec.width - block)
+                y = (i * 3 + shot * 97) % max(1, spec.height - block)
+                frame[y:y + block, x:x + block] = colour
+                noise = rng.integers(0, 12, (spec.height // 8, spec.width // 8), dtype=np.uint8)
+                noise = cv2.resize(noise, (spec.width, spec.height), interpolation=cv2.INTER_NEAREST)
+                writer.write(cv2.add(frame, cv2.merge([noise, noise, noise])))
+    finally:
+        writer.release()
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,36 @@
+"""Add cache_entries table
+
+Revision ID: 3f7c2a91d4e8
+Revises: 9885d0debd63
+Create Date: 2026-10-17 19:40:12.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7c2a91d4e8'
+down_revision: Union[str, None] = '9885d0debd63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cache_entries',
+        sa.Column('namespace', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('namespace', 'key'),
+    )
+    op.create_index(op.f('ix_cache_entries_expires_at'), 'cache_entries', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cache_entries_expires_at'), table_name='cache_entries')
+    op.drop_table('cache_entries')
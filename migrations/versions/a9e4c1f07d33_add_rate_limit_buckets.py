@@ -0,0 +1,32 @@
+"""Add rate_limit_buckets
+
+Revision ID: a9e4c1f07d33
+Revises: f3a7d2c95e14
+Create Date: 2026-10-17 22:41:08.217604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9e4c1f07d33'
+down_revision: Union[str, None] = 'f3a7d2c95e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rate_limit_buckets')
@@ -0,0 +1,58 @@
+"""Add canonical_key to recipes and import_jobs
+
+Revision ID: b81e5d0c6a27
+Revises: 3f7c2a91d4e8
+Create Date: 2026-10-17 20:05:47.913362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils import canonical_key
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81e5d0c6a27'
+down_revision: Union[str, None] = '3f7c2a91d4e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_JOB = sa.text("status IN ('queued', 'processing')")
+
+
+def _backfill(conn, table: str, where: str = "") -> None:
+    """Fill canonical_key from source_url, oldest row first; later duplicates stay NULL"""
+    seen = set()
+    rows = conn.execute(sa.text(f"SELECT id, source_url FROM {table} {where} ORDER BY created_at")).fetchall()
+    for row_id, source_url in rows:
+        if not source_url:
+            continue
+        key = canonical_key(source_url)
+        if key in seen:
+            continue
+        seen.add(key)
+        conn.execute(sa.text(f"UPDATE {table} SET canonical_key = :key WHERE id = :id"), {"key": key, "id": row_id})
+
+
+def upgrade() -> None:
+    op.add_column('recipes', sa.Column('canonical_key', sa.String(), nullable=True))
+    op.add_column('import_jobs', sa.Column('canonical_key', sa.String(), nullable=True))
+
+    conn = op.get_bind()
+    _backfill(conn, 'recipes')
+    _backfill(conn, 'import_jobs', "WHERE status IN ('queued', 'processing')")
+
+    op.create_index(op.f('ix_recipes_canonical_key'), 'recipes', ['canonical_key'], unique=True)
+    op.create_index(
+        'ux_import_jobs_active_canonical_key', 'import_jobs', ['canonical_key'], unique=True,
+        sqlite_where=ACTIVE_JOB, postgresql_where=ACTIVE_JOB,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ux_import_jobs_active_canonical_key', table_name='import_jobs')
+    op.drop_index(op.f('ix_recipes_canonical_key'), table_name='recipes')
+    op.drop_column('import_jobs', 'canonical_key')
+    op.drop_column('recipes', 'canonical_key')
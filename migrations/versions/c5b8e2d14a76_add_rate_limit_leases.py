@@ -0,0 +1,32 @@
+"""Add rate_limit_leases
+
+Revision ID: c5b8e2d14a76
+Revises: a9e4c1f07d33
+Create Date: 2026-10-18 10:12:44.530128
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5b8e2d14a76'
+down_revision: Union[str, None] = 'a9e4c1f07d33'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rate_limit_leases',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('lease', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('name', 'lease'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rate_limit_leases')
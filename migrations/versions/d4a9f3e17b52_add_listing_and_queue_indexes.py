@@ -0,0 +1,29 @@
+"""Add recipe listing and queue scan indexes
+
+Revision ID: d4a9f3e17b52
+Revises: b81e5d0c6a27
+Create Date: 2026-10-17 20:31:05.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a9f3e17b52'
+down_revision: Union[str, None] = 'b81e5d0c6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_recipes_created_at_id', 'recipes', ['created_at', 'id'], unique=False)
+    op.create_index('ix_import_jobs_status_created_at', 'import_jobs', ['status', 'created_at'], unique=False)
+    op.create_index(op.f('ix_import_jobs_recipe_id'), 'import_jobs', ['recipe_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_import_jobs_recipe_id'), table_name='import_jobs')
+    op.drop_index('ix_import_jobs_status_created_at', table_name='import_jobs')
+    op.drop_index('ix_recipes_created_at_id', table_name='recipes')
@@ -0,0 +1,26 @@
+"""Add import job stage
+
+Revision ID: e6c1b8a4f920
+Revises: d4a9f3e17b52
+Create Date: 2026-10-17 21:12:44.502317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c1b8a4f920'
+down_revision: Union[str, None] = 'd4a9f3e17b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('import_jobs', sa.Column('stage', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('import_jobs', 'stage')
@@ -0,0 +1,65 @@
+"""Add recipe ingredient/tag tables and full-text search index
+
+Revision ID: f3a7d2c95e14
+Revises: e6c1b8a4f920
+Create Date: 2026-10-17 22:03:19.664120
+
+Populate existing recipes afterwards with `python -m app.search`.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a7d2c95e14'
+down_revision: Union[str, None] = 'e6c1b8a4f920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RECIPE_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5("
+        "recipe_id UNINDEXED, title, ingredients, tags, tokenize = 'porter unicode61')",
+    ],
+    "postgresql": [
+        "CREATE TABLE IF NOT EXISTS recipe_search ("
+        "recipe_id VARCHAR PRIMARY KEY REFERENCES recipes (id) ON DELETE CASCADE, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_recipe_search_document ON recipe_search USING GIN (document)",
+    ],
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recipe_ingredients',
+        sa.Column('recipe_id', sa.String(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('quantity', sa.String(), nullable=True),
+        sa.Column('unit', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('recipe_id', 'position'),
+    )
+    op.create_index(op.f('ix_recipe_ingredients_name'), 'recipe_ingredients', ['name'], unique=False)
+    op.create_table(
+        'recipe_tags',
+        sa.Column('recipe_id', sa.String(), nullable=False),
+        sa.Column('tag', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('recipe_id', 'tag'),
+    )
+    op.create_index('ix_recipe_tags_tag_recipe_id', 'recipe_tags', ['tag', 'recipe_id'], unique=False)
+
+    for statement in RECIPE_SEARCH_DDL.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS recipe_search")
+    op.drop_index('ix_recipe_tags_tag_recipe_id', table_name='recipe_tags')
+    op.drop_table('recipe_tags')
+    op.drop_index(op.f('ix_recipe_ingredients_name'), table_name='recipe_ingredients')
+    op.drop_table('recipe_ingredients')
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import tempfile
+
+# Settings are read at import time: point the app at a throwaway SQLite database
+# and the in-process queue before anything under app/ is imported
+_workdir = tempfile.mkdtemp(prefix="eylo-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_workdir}/test.db",
+    "REDIS_URL": "memory://",
+    "APIFY_API_TOKEN": "test",
+    "OPENAI_API_KEY": "test",
+    "JWT_SECRET": "test",
+})
+
+import pytest  # noqa: E402
+
+from app.database import Base, async_engine, engine  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop (pooled async connections don't outlive it)"""
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,131 @@
+import json
+import uuid
+
+import fakeredis
+import pytest
+
+from app import queue
+from app.database import ImportJob, SessionLocal
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """The reliable Redis queue, on an in-process fake server"""
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(queue, "USE_REDIS", True)
+    monkeypatch.setattr(queue, "redis_client", client)
+    monkeypatch.setattr(queue, "WORKER_ID", "worker-a")
+    monkeypatch.setattr(queue, "_claimed", {})
+    return client
+
+
+def _job(status: str = "queued") -> dict:
+    job = {"job_id": str(uuid.uuid4()), "user_id": "test", "source_url": f"https://www.tiktok.com/@test/video/{uuid.uuid4().int % 10**12}"}
+    db = SessionLocal()
+    try:
+        db.add(ImportJob(id=job["job_id"], user_id=job["user_id"], source_url=job["source_url"], canonical_key=job["source_url"], status=status, stage=status))
+        db.commit()
+    finally:
+        db.close()
+    return job
+
+
+async def _crash(redis, monkeypatch, worker_id: str):
+    """`worker_id` dies without acking: its heartbeat expires and another worker reaps it"""
+    await redis.delete(queue.HEARTBEAT_KEY.format(worker_id))
+    monkeypatch.setattr(queue, "WORKER_ID", f"reaper-{uuid.uuid4().hex[:6]}")
+    monkeypatch.setattr(queue, "_claimed", {})
+    return await queue.reap_expired()
+
+
+def test_expired_heartbeat_redelivers_job(run, redis, monkeypatch):
+    job = _job()
+
+    async def scenario():
+        await queue.enqueue_recipe_imports([job])
+        first = await queue.dequeue_recipe_imports(limit=1, timeout=1)
+        requeued = await _crash(redis, monkeypatch, "worker-a")
+        second = await queue.dequeue_recipe_imports(limit=1, timeout=1)
+        return first, requeued, second, await redis.hget(queue.DELIVERIES_KEY, job["job_id"]), await redis.sismember(queue.WORKERS_KEY, "worker-a")
+
+    first, requeued, second, deliveries, dead_registered = run(scenario())
+    assert [j["job_id"] for j in first] == [job["job_id"]]
+    assert requeued == 1
+    assert [j["job_id"] for j in second] == [job["job_id"]]
+    assert deliveries == "2"
+    assert not dead_registered
+
+
+def test_ack_removes_job(run, redis):
+    job = _job()
+
+    async def scenario():
+        await queue.enqueue_recipe_imports([job])
+        (claimed,) = await queue.dequeue_recipe_imports(limit=1, timeout=1)
+        await queue.ack_recipe_import(claimed)
+        return (
+            await redis.llen(queue.PROCESSING_KEY.format("worker-a")),
+            await redis.llen(queue.RECIPE_QUEUE),
+            await redis.hexists(queue.DELIVERIES_KEY, job["job_id"]),
+        )
+
+    processing, pending, tracked = run(scenario())
+    assert (processing, pending, tracked) == (0, 0, False)
+    assert queue._claimed == {}
+
+
+def test_job_is_dead_lettered_after_retry_attempts(run, redis, monkeypatch):
+    monkeypatch.setattr(queue.settings, "retry_attempts", 2)
+    job = _job(status="processing")
+
+    async def scenario():
+        await queue.enqueue_recipe_imports([job])
+        deliveries = []
+        for _ in range(queue.settings.retry_attempts):
+            deliveries.append(await queue.dequeue_recipe_imports(limit=1, timeout=1))
+            await _crash(redis, monkeypatch, queue.WORKER_ID)
+        last = await queue.dequeue_recipe_imports(limit=1, timeout=1)
+        return (
+            deliveries,
+            last,
+            await redis.lrange(queue.DEAD_LETTER_QUEUE, 0, -1),
+            await redis.llen(queue.PROCESSING_KEY.format(queue.WORKER_ID)),
+            await redis.hexists(queue.DELIVERIES_KEY, job["job_id"]),
+        )
+
+    deliveries, last, dead, processing, tracked = run(scenario())
+    assert all(len(d) == 1 for d in deliveries)
+    assert last == []
+    assert [json.loads(raw)["job_id"] for raw in dead] == [job["job_id"]]
+    assert processing == 0 and not tracked
+
+    db = SessionLocal()
+    try:
+        row = db.get(ImportJob, job["job_id"])
+        assert row.status == "failed"
+        assert "dead-letter" in row.error_message
+        assert row.completed_at is not None
+    finally:
+        db.close()
+
+
+def test_release_worker_is_not_a_failed_delivery(run, redis):
+    job = _job()
+
+    async def scenario():
+        await queue.enqueue_recipe_imports([job])
+        await queue.dequeue_recipe_imports(limit=1, timeout=1)
+        await queue.release_worker()
+        handed_back = (
+            await redis.hget(queue.DELIVERIES_KEY, job["job_id"]),
+            await redis.llen(queue.RECIPE_QUEUE),
+            await redis.sismember(queue.WORKERS_KEY, "worker-a"),
+            await redis.exists(queue.HEARTBEAT_KEY.format("worker-a")),
+        )
+        again = await queue.dequeue_recipe_imports(limit=1, timeout=1)
+        return handed_back, again, await redis.hget(queue.DELIVERIES_KEY, job["job_id"])
+
+    (deliveries, pending, registered, heartbeat), again, redelivered = run(scenario())
+    assert (deliveries, pending, registered, heartbeat) == ("0", 1, False, 0)
+    assert [j["job_id"] for j in again] == [job["job_id"]]
+    assert redelivered == "1"
@@ -0,0 +1,34 @@
+import asyncio
+
+from app.services.rate_limit import AdaptiveConcurrency
+
+
+def test_growing_limit_wakes_waiters(run):
+    async def scenario():
+        limit = AdaptiveConcurrency("test", maximum=4, initial=1)
+        release = asyncio.Event()
+        entered = asyncio.Event()
+
+        async def holder():
+            async with limit.slot():
+                await release.wait()
+
+        async def waiter():
+            async with limit.slot():
+                entered.set()
+
+        tasks = [asyncio.create_task(holder())]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(waiter()))
+        await asyncio.sleep(0.01)
+        blocked = not entered.is_set()
+
+        await limit.on_success()  # 1 -> 2 slots, while the holder still has its slot
+        await asyncio.wait_for(entered.wait(), timeout=1.0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return blocked, limit.limit
+
+    blocked, grown = run(scenario())
+    assert blocked
+    assert grown == 2.0
@@ -0,0 +1,70 @@
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.database import AsyncSessionLocal, Recipe
+from app.search import index_recipe, search_recipe_ids
+
+
+async def _add_recipes(db, recipes):
+    """Insert and index (title, ingredients, tags) tuples, oldest first; returns their ids"""
+    ids = []
+    started = datetime.utcnow()
+    for n, (title, ingredients, tags) in enumerate(recipes):
+        recipe = Recipe(
+            id=str(uuid.uuid4()),
+            user_id="test",
+            title=title,
+            source_url=f"https://example.com/{uuid.uuid4().hex}",
+            source_type="tiktok",
+            data={"title": title, "ingredients": [{"item": i, "quantity": "1", "unit": ""} for i in ingredients], "steps": [], "tags": tags},
+            created_at=started + timedelta(seconds=n),
+        )
+        db.add(recipe)
+        await db.flush()
+        await index_recipe(db, recipe)
+        ids.append(recipe.id)
+    await db.commit()
+    return ids
+
+
+def _without_full_text(db, monkeypatch):
+    """Make search see a dialect it has no full-text index for (queries still run on SQLite)"""
+    monkeypatch.setattr(db, "get_bind", lambda *args, **kwargs: SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+
+
+def test_search_falls_back_to_substring_matching(run, monkeypatch):
+    tag = uuid.uuid4().hex[:8]
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            hummus, stew, cake = await _add_recipes(db, [
+                ("Lemony hummus", ["canned chickpeas", "tahini"], [tag]),
+                ("Chickpea stew", ["chickpeas", "tomato"], [tag, "dinner"]),
+                ("Carrot cake", ["carrot", "flour"], [tag]),
+            ])
+            _without_full_text(db, monkeypatch)
+            by_ingredient = await search_recipe_ids(db, ingredients=["chickpea"], tags=[tag])
+            by_text = await search_recipe_ids(db, q="CHICKPEA stew", tags=[tag])
+            by_tag_word = await search_recipe_ids(db, q="dinner", tags=[tag])
+            return (hummus, stew, cake), by_ingredient, by_text, by_tag_word
+
+    (hummus, stew, cake), by_ingredient, by_text, by_tag_word = run(scenario())
+    assert by_ingredient == [stew, hummus]  # newest first
+    assert by_text == [stew]
+    assert by_tag_word == [stew]
+
+
+def test_search_fallback_treats_wildcards_literally(run, monkeypatch):
+    tag = uuid.uuid4().hex[:8]
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            (discount,) = await _add_recipes(db, [("Soup 100% veg", ["leek"], [tag])])
+            await _add_recipes(db, [("Plain soup", ["potato"], [tag])])
+            _without_full_text(db, monkeypatch)
+            return discount, await search_recipe_ids(db, q="%", tags=[tag]), await search_recipe_ids(db, ingredients=["_"], tags=[tag])
+
+    discount, percent, underscore = run(scenario())
+    assert percent == [discount]
+    assert underscore == []